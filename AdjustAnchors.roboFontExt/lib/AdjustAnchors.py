@@ -5,29 +5,53 @@
 # add support for accents with multiple anchors
 # - this will require significant changes to the WriteFeaturesMarkFDK module
 
-from itertools import product
+import os
+from itertools import product, islice
 from mojo.roboFont import CurrentFont, CurrentGlyph, RGlyph, AllFonts
-from mojo.roboFont import version as roboFontVersion
 from mojo.drawingTools import (newPath, moveTo, lineTo, curveTo, closePath,
-                               drawPath, translate, fill, strokeWidth)
+                               drawPath, translate, fill, strokeWidth, stroke,
+                               line, oval)
 from mojo.events import addObserver, removeObserver
 from mojo.extensions import getExtensionDefault, setExtensionDefault
-from mojo.UI import UpdateCurrentGlyphView, MultiLineView, OutputWindow
+from mojo.UI import UpdateCurrentGlyphView, OutputWindow
 from vanilla import (FloatingWindow, List, TextBox, EditText, CheckBox, Group,
-                     HorizontalLine, ScrollView)
+                     HorizontalLine, ScrollView, Button, PopUpButton, Sheet,
+                     CheckBoxListCell)
+from vanilla.dialogs import getFile
 from defconAppKit.windows.baseWindow import BaseWindowController
 from fontTools.pens.basePen import BasePen
 from fontTools.pens.transformPen import TransformPen
-from fontTools.misc.transform import Identity
 from defconAppKit.controls.openTypeControlsView import (
     DefconAppKitTopAnchoredNSView)
 from AppKit import NSNumber, NSNumberFormatter, NSBeep, NSNoBorder
+from anchorIndex import CONTEXTUAL_ANCHOR_TAG, AnchorIndex
+from anchorBatch import (MOVE_MODE, ALIGN_MODE, BATCH_MODES,
+                         VERTICAL_METRICS, getVerticalMetric,
+                         getAnchorClassGlyphNames, computeAnchorPositions,
+                         applyAnchorPositions)
+from anchorSuggestions import (BOUNDS_CENTER_MODE, ITALIC_CENTER_MODE,
+                               AnchorSuggestionEngine)
+from previewGlyphs import newPreviewGlyph, getMissingComponentName
+from combinationFrequency import CombinationFrequencies
+from markStacks import MarkStackAssembler
+from tileLineView import TileLineView
 
 extensionKey = "com.adobe.AdjustAnchors"
 extensionName = "Adjust Anchors"
 
-# NOTE: Contextual anchors on mark glyphs are currently NOT supported
-CONTEXTUAL_ANCHOR_TAG = "CXT"
+# largest number of mark stacks previewed for a base glyph
+MAX_MARK_STACKS = 500
+# the number of marks stacked is the index of the title + 1
+MARK_STACK_TITLES = ["Single Marks", "Stacks of 2", "Stacks of 3",
+                     "Stacks of 4"]
+
+# (title in the UI, mode) of the actions of the batch sheet
+ANCHOR_BATCH_ACTIONS = [
+    ("Move by X & Y", MOVE_MODE),
+    ("Align Y to vertical metric", ALIGN_MODE),
+    ("Center X on outline bounds", BOUNDS_CENTER_MODE),
+    ("Center on italic outline at metric", ITALIC_CENTER_MODE),
+]
 
 
 class AdjustAnchors(BaseWindowController):
@@ -36,19 +60,22 @@ class AdjustAnchors(BaseWindowController):
         self.font = CurrentFont()
         self.glyph = CurrentGlyph()
         self.upm = self.font.info.unitsPerEm
-        self.rf3 = int(roboFontVersion.split(".")[0]) >= 3
-        if self.rf3:
-            self.layer = CurrentLayer()
         # key: glyph name -- value: list containing assembled glyphs
         self.glyphPreviewCacheDict = {}
+        # names of the glyphs whose missing components were reported
+        self.warnedGlyphNamesSet = set()
+        self.anchorIndex = AnchorIndex()
         # key: anchor name -- value: list of mark glyph names
-        self.anchorsOnMarksDict = {}
+        self.anchorsOnMarksDict = self.anchorIndex.anchorsOnMarksDict
         # key: anchor name -- value: list of base glyph names
-        self.anchorsOnBasesDict = {}
-        self.CXTanchorsOnBasesDict = {}
+        self.anchorsOnBasesDict = self.anchorIndex.anchorsOnBasesDict
+        self.CXTanchorsOnBasesDict = self.anchorIndex.CXTanchorsOnBasesDict
         # key: mark glyph name -- value: anchor name
         # NOTE: It's expected that each mark glyph only has one type of anchor
-        self.marksDict = {}
+        self.marksDict = self.anchorIndex.marksDict
+        # assembles (and caches) the stacks of marks on a base glyph
+        self.markStackAssembler = MarkStackAssembler(
+            self.font, self.anchorIndex)
         self.fillAnchorsAndMarksDicts()
         # list of glyph names that will be displayed in the UI list
         self.glyphNamesList = []
@@ -57,6 +84,13 @@ class AdjustAnchors(BaseWindowController):
         # list of the glyph objects that should be inserted
         # before and after the accented glyphs
         self.extraGlyphsList = []
+        # list of (anchor name, positions dict) tuples that undo
+        # the batch edits, the last one at the end
+        self.anchorBatchUndoList = []
+        # (anchor name, positions dict) of the batch shown in the sheet
+        self.anchorBatchPreview = None
+        # when set, the combinations are listed by decreasing frequency
+        self.combinationFrequencies = None
 
         self.Blue, self.Alpha = 1, 0.6
 
@@ -107,6 +141,29 @@ class AdjustAnchors(BaseWindowController):
         if not self.extraGlyphs:
             self.extraGlyphs = ''
 
+        self.markStackDepth = getExtensionDefault(
+            "%s.%s" % (extensionKey, "markStackDepth"))
+        if not self.markStackDepth:
+            self.markStackDepth = 1
+
+        self.frequencyIndexPath = getExtensionDefault(
+            "%s.%s" % (extensionKey, "frequencyIndexPath"))
+        if self.frequencyIndexPath and os.path.exists(
+                self.frequencyIndexPath):
+            try:
+                self.combinationFrequencies = CombinationFrequencies.load(
+                    self.frequencyIndexPath)
+            except Exception:
+                print("ERROR: %s is not a frequency index." %
+                      self.frequencyIndexPath)
+                self.frequencyIndexPath = ''
+        else:
+            self.frequencyIndexPath = ''
+        if not self.frequencyIndexPath:
+            # don't try to load it again next time
+            setExtensionDefault(
+                "%s.%s" % (extensionKey, "frequencyIndexPath"), '')
+
         posSize = getExtensionDefault(
             "%s.%s" % (extensionKey, "posSize"))
         if not posSize:
@@ -136,16 +193,11 @@ class AdjustAnchors(BaseWindowController):
         self.w = FloatingWindow(posSize, extensionName, minSize=(500, 400))
         self.w.fontList = List((10, 10, 190, -41), self.glyphNamesList,
                                selectionCallback=self.listSelectionCallback)
-        if roboFontVersion < '1.7':
-            # use the full width of the column
-            self.w.fontList.getNSTableView().sizeToFit()
         self.w.fontList.show(not self.calibrateMode)
-        self.w.lineView = MultiLineView((210, 10, -10, -41),
-                                        pointSize=self.textSize,
-                                        lineHeight=self.lineHeight,
-                                        displayOptions={"Beam": False,
-                                        "displayMode": "Multi Line"}
-                                        )
+        # repaints draw the cached raster tiles of the combinations
+        self.w.lineView = TileLineView((210, 10, -10, -41),
+                                       pointSize=self.textSize,
+                                       lineHeight=self.lineHeight)
         self.w.lineView.setFont(self.font)
         # -- Calibration Mode --
         baseLabel = "Bases"
@@ -240,8 +292,18 @@ class AdjustAnchors(BaseWindowController):
         self.w.footer.extraGlyphsLabel = TextBox(
             (655, 2, 180, -0), "Extra Glyphs")
         self.w.footer.extraGlyphs = EditText(
-            (739, 0, -0, -0), self.extraGlyphs,
+            (739, 0, -300, -0), self.extraGlyphs,
             callback=self.extraGlyphsCallback, continuous=False)
+        self.w.footer.markStackDepth = PopUpButton(
+            (-290, 1, -195, -0), MARK_STACK_TITLES,
+            callback=self.markStackDepthCallback)
+        self.w.footer.markStackDepth.set(
+            min(self.markStackDepth, len(MARK_STACK_TITLES)) - 1)
+        self.w.footer.frequenciesButton = Button(
+            (-185, 0, -90, -0), "Frequencies...",
+            callback=self.frequenciesCallback)
+        self.w.footer.batchButton = Button(
+            (-80, 0, -0, -0), "Batch...", callback=self.batchSheetCallback)
 
         # trigger the initial state and contents of the window
         self.extraGlyphsCallback()  # calls self.updateExtensionWindow()
@@ -290,25 +352,240 @@ class AdjustAnchors(BaseWindowController):
         for gName in glyphNamesList:
             try:
                 extraGlyph = self.font[gName]
-                # must create a new glyph in order to be able to
-                # increase the sidebearings without modifying the font
-                newGlyph = RGlyph()
-                if self.rf3:
-                    newGlyph.layer = self.layer
-                else:
-                    newGlyph.font = newGlyph.getParent()
-                # must use deepAppend because the extra glyph may have
-                # components (which will cause problems to the MultiLineView)
-                newGlyph = self.deepAppendGlyph(newGlyph, extraGlyph)
-                newGlyph.width = extraGlyph.width
             except Exception:
                 continue
+            # must create a new glyph in order to be able to
+            # increase the sidebearings without modifying the font
+            newGlyph = self.newPreviewGlyph([(gName, (0, 0))],
+                                            extraGlyph.width)
             newGlyph.leftMargin += self.extraSidebearings[0]
             newGlyph.rightMargin += self.extraSidebearings[1]
             self.extraGlyphsList.append(newGlyph)
         self.glyphPreviewCacheDict.clear()
         self.updateExtensionWindow()
 
+    def markStackDepthCallback(self, sender):
+        self.markStackDepth = sender.get() + 1
+        self.glyphPreviewCacheDict.clear()
+        self.updateExtensionWindow()
+
+    def frequenciesCallback(self, sender):
+        getFile(
+            messageText="Choose a frequency index made by "
+                        "combinationFrequency.py, or cancel to list the "
+                        "combinations in glyph order.",
+            fileTypes=["npz"], parentWindow=self.w,
+            resultCallback=self.loadCombinationFrequencies)
+
+    def loadCombinationFrequencies(self, pathsList):
+        if pathsList:
+            try:
+                self.combinationFrequencies = CombinationFrequencies.load(
+                    pathsList[0])
+            except Exception:
+                NSBeep()
+                print("ERROR: %s is not a frequency index." % pathsList[0])
+                return
+            self.frequencyIndexPath = pathsList[0]
+        else:
+            self.combinationFrequencies = None
+            self.frequencyIndexPath = ''
+        self.glyphPreviewCacheDict.clear()
+        self.updateExtensionWindow()
+
+    def batchSheetCallback(self, sender):
+        integerNumFormatter = NSNumberFormatter.alloc().init()
+        integerNumFormatter.setAllowsFloats_(False)
+        integerNumFormatter.setGeneratesDecimalNumbers_(False)
+
+        # base anchors first, then the mark anchors
+        self.anchorBatchNamesList = sorted(self.anchorsOnBasesDict)
+        self.anchorBatchNamesList.extend(sorted(self.CXTanchorsOnBasesDict))
+        self.anchorBatchNamesList.extend(
+            ['_' + anchorName for anchorName in sorted(
+                self.anchorsOnMarksDict)])
+
+        self.batchSheet = Sheet((420, 440), self.w, minSize=(420, 300))
+        self.batchSheet.anchorLabel = TextBox((15, 17, 80, 20), "Anchor")
+        self.batchSheet.anchorName = PopUpButton(
+            (100, 15, -15, 22), self.anchorBatchNamesList,
+            callback=self.anchorBatchOptionsCallback)
+        self.batchSheet.scopeLabel = TextBox((15, 47, 80, 20), "Glyphs")
+        self.batchSheet.scope = PopUpButton(
+            (100, 45, -15, 22), ["All glyphs with the anchor",
+                                 "Glyphs selected in the font"],
+            callback=self.anchorBatchOptionsCallback)
+        self.batchSheet.modeLabel = TextBox((15, 77, 80, 20), "Action")
+        self.batchSheet.mode = PopUpButton(
+            (100, 75, -15, 22),
+            [title for title, mode in ANCHOR_BATCH_ACTIONS],
+            callback=self.anchorBatchOptionsCallback)
+        self.batchSheet.metricLabel = TextBox((15, 107, 80, 20), "Metric")
+        self.batchSheet.metric = PopUpButton(
+            (100, 105, -15, 22), VERTICAL_METRICS,
+            callback=self.anchorBatchOptionsCallback)
+        self.batchSheet.deltaLabel = TextBox((15, 137, 80, 20), "X & Y")
+        self.batchSheet.deltaX = EditText(
+            (100, 135, 50, 22), 0, formatter=integerNumFormatter,
+            callback=self.anchorBatchOptionsCallback, continuous=False)
+        self.batchSheet.deltaY = EditText(
+            (160, 135, 50, 22), 0, formatter=integerNumFormatter,
+            callback=self.anchorBatchOptionsCallback, continuous=False)
+        self.batchSheet.previewList = List(
+            (15, 170, -15, -70), [],
+            columnDescriptions=[
+                {"title": "", "key": "apply", "width": 20,
+                 "cell": CheckBoxListCell(), "editable": True},
+                {"title": "Glyph", "key": "glyphName", "editable": False},
+                {"title": "Current", "key": "current", "editable": False},
+                {"title": "New", "key": "new", "editable": False},
+                {"title": "Shift", "key": "shift", "editable": False}])
+        self.batchSheet.status = TextBox((15, -60, -15, 20), "")
+        self.batchSheet.undoButton = Button(
+            (15, -35, 120, 20), "Undo Last Batch",
+            callback=self.undoAnchorBatchCallback)
+        self.batchSheet.undoButton.enable(bool(self.anchorBatchUndoList))
+        self.batchSheet.closeButton = Button(
+            (-255, -35, 75, 20), "Close", callback=self.closeBatchSheet)
+        self.batchSheet.previewButton = Button(
+            (-170, -35, 75, 20), "Preview",
+            callback=self.previewAnchorBatchCallback)
+        self.batchSheet.applyButton = Button(
+            (-90, -35, 75, 20), "Apply",
+            callback=self.applyAnchorBatchCallback)
+        self.batchSheet.setDefaultButton(self.batchSheet.applyButton)
+        self.batchSheet.open()
+
+    def closeBatchSheet(self, sender):
+        self.clearAnchorBatchPreview()
+        self.batchSheet.close()
+        del self.batchSheet
+
+    def computeAnchorBatch(self):
+        """
+        Returns the anchor name and the positions dict of the batch set up
+        in the sheet, or None if it can't be computed.
+        """
+        if not self.anchorBatchNamesList:
+            return None
+        anchorName = self.anchorBatchNamesList[
+            self.batchSheet.anchorName.get()]
+        if self.batchSheet.scope.get() == 0:
+            glyphNamesList = None  # all the glyphs with the anchor
+        else:
+            glyphNamesList = list(self.font.selection)
+        try:  # in case the user submits an empty field
+            delta = (int(self.batchSheet.deltaX.get()),
+                     int(self.batchSheet.deltaY.get()))
+        except Exception:
+            return None
+        metricName = VERTICAL_METRICS[self.batchSheet.metric.get()]
+        title, mode = ANCHOR_BATCH_ACTIONS[self.batchSheet.mode.get()]
+
+        if mode in BATCH_MODES:
+            if glyphNamesList is None:
+                glyphNamesList = getAnchorClassGlyphNames(
+                    self.font, anchorName)
+            positionsDict = computeAnchorPositions(
+                self.font, glyphNamesList, anchorName, mode, delta,
+                metricName)
+        else:
+            if mode == ITALIC_CENTER_MODE:
+                height = getVerticalMetric(self.font, metricName)
+            else:
+                height = None  # keep the anchors' heights
+            positionsDict = AnchorSuggestionEngine(
+                self.font).suggestAnchorPositions(
+                anchorName, mode, glyphNamesList, height=height, delta=delta)
+        return anchorName, positionsDict
+
+    def anchorBatchOptionsCallback(self, sender):
+        self.clearAnchorBatchPreview()
+
+    def clearAnchorBatchPreview(self):
+        self.anchorBatchPreview = None
+        if hasattr(self, "batchSheet"):
+            self.batchSheet.previewList.set([])
+        self.updateGlyphView()
+
+    def previewAnchorBatchCallback(self, sender):
+        batch = self.computeAnchorBatch()
+        if batch is None:
+            NSBeep()
+            return
+        anchorName, positionsDict = batch
+        previewItems = []
+        for glyphName in self.font.glyphOrder:
+            if glyphName not in positionsDict:
+                continue
+            (oldX, oldY), (newX, newY) = positionsDict[glyphName]
+            previewItems.append({
+                "apply": True,
+                "glyphName": glyphName,
+                "current": "%g, %g" % (oldX, oldY),
+                "new": "%g, %g" % (newX, newY),
+                "shift": "%+g, %+g" % (newX - oldX, newY - oldY)})
+        self.anchorBatchPreview = batch
+        self.batchSheet.previewList.set(previewItems)
+        self.batchSheet.status.set(
+            "%d '%s' anchors would move." % (len(previewItems), anchorName))
+        # the current glyph's new anchor position is drawn by _drawGlyphs
+        self.updateGlyphView()
+
+    def applyAnchorBatchCallback(self, sender):
+        if self.anchorBatchPreview is not None:
+            # only apply the rows that are checked in the preview
+            anchorName, positionsDict = self.anchorBatchPreview
+            positionsDict = dict(
+                (item["glyphName"], positionsDict[item["glyphName"]])
+                for item in self.batchSheet.previewList.get()
+                if item["apply"])
+        else:
+            batch = self.computeAnchorBatch()
+            if batch is None:
+                NSBeep()
+                return
+            anchorName, positionsDict = batch
+        if not positionsDict:
+            NSBeep()
+            self.batchSheet.status.set("No anchors to move.")
+            return
+
+        # the font's observers (including fontWasModified)
+        # get notified only once, after all the anchors are moved
+        undoPositionsDict, skippedNamesList = applyAnchorPositions(
+            self.font, anchorName, positionsDict)
+        self.anchorBatchUndoList.append((anchorName, undoPositionsDict))
+        self.clearAnchorBatchPreview()
+        self.batchSheet.undoButton.enable(True)
+        self.batchSheet.status.set(self.getAnchorBatchStatus(
+            "Moved", anchorName, undoPositionsDict, skippedNamesList))
+
+    def undoAnchorBatchCallback(self, sender):
+        if not self.anchorBatchUndoList:
+            NSBeep()
+            return
+        anchorName, undoPositionsDict = self.anchorBatchUndoList.pop()
+        # the anchors edited after the batch are kept as they are
+        restoredPositionsDict, skippedNamesList = applyAnchorPositions(
+            self.font, anchorName, undoPositionsDict)
+        self.clearAnchorBatchPreview()
+        self.batchSheet.undoButton.enable(bool(self.anchorBatchUndoList))
+        self.batchSheet.status.set(self.getAnchorBatchStatus(
+            "Restored", anchorName, restoredPositionsDict, skippedNamesList))
+
+    def getAnchorBatchStatus(self, action, anchorName, positionsDict,
+                             skippedNamesList):
+        status = "%s %d '%s' anchors." % (
+            action, len(positionsDict), anchorName)
+        if skippedNamesList:
+            status += " Skipped %d edited since: %s" % (
+                len(skippedNamesList), " ".join(skippedNamesList))
+            print("WARNING: The '%s' anchors of these glyphs were edited "
+                  "since, and were left alone: %s" % (
+                      anchorName, " ".join(skippedNamesList)))
+        return status
+
     def windowClose(self, sender):
         self.font.naked().removeObserver(self, "Font.Changed")
         removeObserver(self, "fontWillClose")
@@ -340,6 +617,10 @@ class AdjustAnchors(BaseWindowController):
                             self.extraSidebearings)
         setExtensionDefault("%s.%s" % (extensionKey, "extraGlyphs"),
                             self.extraGlyphs)
+        setExtensionDefault("%s.%s" % (extensionKey, "markStackDepth"),
+                            self.markStackDepth)
+        setExtensionDefault("%s.%s" % (extensionKey, "frequencyIndexPath"),
+                            self.frequencyIndexPath)
         setExtensionDefault("%s.%s" % (extensionKey, "calibrateMode"),
                             self.calibrateMode)
         setExtensionDefault("%s.%s" % (extensionKey, "calibrateModeStrings"),
@@ -365,6 +646,10 @@ class AdjustAnchors(BaseWindowController):
         self.font.naked().addObserver(self, "fontWasModified", "Font.Changed")
         self.w.lineView.setFont(self.font)
         self.fillAnchorsAndMarksDicts()
+        # the batch edits belong to the previous font
+        del self.anchorBatchUndoList[:]
+        if self.anchorBatchPreview is not None:
+            self.clearAnchorBatchPreview()
         del self.glyphNamesList[:]
         del self.selectedGlyphNamesList[:]
         self.updateExtensionWindow()
@@ -375,58 +660,36 @@ class AdjustAnchors(BaseWindowController):
     def fontWasModified(self, info):
         OutputWindow().clear()
         self.fillAnchorsAndMarksDicts()
+        # the previewed positions may be out of date
+        if self.anchorBatchPreview is not None:
+            self.clearAnchorBatchPreview()
         del self.glyphNamesList[:]
         del self.selectedGlyphNamesList[:]
         self.updateExtensionWindow()
 
-    def deepAppendGlyph(self, glyph, gToAppend, offset=(0, 0)):
-        if not gToAppend.components:
-            glyph.appendGlyph(gToAppend, offset)
-        else:
-            for component in gToAppend.components:
-                # avoid traceback in the case where the selected glyph is
-                # referencing a component whose glyph is not in the font
-                if component.baseGlyph not in self.font.keys():
-                    print("WARNING: %s is referencing a glyph named %s, which "
-                          "does not exist in the font." %
-                          (self.font.selection[0], component.baseGlyph))
-                    continue
-
-                compGlyph = self.font[component.baseGlyph].copy()
-
-                # handle component transformations
-                componentTransformation = component.transformation
-                # when undoing a paste anchor or a delete anchor action,
-                # RoboFont returns component.transformation as a list instead
-                # of a tuple
-                if type(componentTransformation) is list:
-                    componentTransformation = tuple(componentTransformation)
-                # if component is skewed and/or is shifted
-                if componentTransformation != (1, 0, 0, 1, 0, 0):
-                    matrix = componentTransformation[0:4]
-                    if matrix != (1, 0, 0, 1):  # if component is skewed
-                        # ignore the original component's shifting values
-                        if self.rf3:
-                            compGlyph.transform(matrix + (0, 0))
-                        else:
-                            transformObj = Identity.transform(matrix + (0, 0))
-                            compGlyph.transform(transformObj)
-
-                # add the two tuples of offset
-                glyph.appendGlyph(
-                    compGlyph, tuple(map(sum, zip(component.offset, offset))))
-            for contour in gToAppend:
-                glyph.appendContour(contour, offset)
-
-        # if the assembled glyph still has components, recursively
-        # remove and replace them 1-by-1 by the glyphs they reference
-        if glyph.components:
-            nestedComponent = glyph.components[-1]  # start from the end
-            glyph.removeComponent(nestedComponent)
-            glyph = self.deepAppendGlyph(glyph,
-                                         self.font[nestedComponent.baseGlyph],
-                                         nestedComponent.offset)
-        return glyph
+    def newPreviewGlyph(self, partsList, width=0):
+        """
+        Returns a glyph made of components that reference the glyphs
+        of the font. partsList is a list of (glyph name, offset) tuples.
+        """
+        return RGlyph(newPreviewGlyph(
+            self.font.naked().layers.defaultLayer, partsList, width))
+
+    def warnMissingComponents(self, glyphNamesList, missingNamesDict):
+        # the glyphs referenced by missing components are skipped
+        # by the preview, but the user should know about them
+        layer = self.font.naked().layers.defaultLayer
+        for glyphName in glyphNamesList:
+            # each glyph is only reported once
+            if glyphName in self.warnedGlyphNamesSet:
+                continue
+            missingName = getMissingComponentName(
+                layer, glyphName, missingNamesDict)
+            if missingName is not None:
+                self.warnedGlyphNamesSet.add(glyphName)
+                print("WARNING: %s is referencing a glyph named %s, which "
+                      "does not exist in the font." %
+                      (glyphName, missingName))
 
     def updateCalibrateMode(self, *sender):
         glyphsList = []
@@ -438,26 +701,26 @@ class AdjustAnchors(BaseWindowController):
             baseGlyphsNamesList = group.baseInput.get().split()
             markGlyphsNamesList = group.markInput.get().split()
 
+            combinationsList = list(product(baseGlyphsNamesList,
+                                            markGlyphsNamesList))
+            # the most frequent combinations first
+            if self.combinationFrequencies is not None:
+                combinationsList = (
+                    self.combinationFrequencies.sortCombinations(
+                        combinationsList))
+
             # iterate thru the base+mark combinations
-            for gBaseName, gMarkName in product(baseGlyphsNamesList,
-                                                markGlyphsNamesList):
-                newGlyph = RGlyph()
-                if self.rf3:
-                    newGlyph.layer = self.layer
-                else:
-                    newGlyph.font = newGlyph.getParent()
+            for gBaseName, gMarkName in combinationsList:
                 # skip invalid glyph names
                 try:
                     baseGlyph = self.font[gBaseName]
                     markGlyph = self.font[gMarkName]
                 except Exception:
                     continue
-                # append base glyph
-                newGlyph = self.deepAppendGlyph(newGlyph, baseGlyph)
-                # append mark glyph
-                newGlyph = self.deepAppendGlyph(
-                    newGlyph, markGlyph, self.getAnchorOffsets(
-                        baseGlyph, markGlyph))
+                # base glyph, and mark glyph shifted by the anchors' offset
+                newGlyph = self.newPreviewGlyph([
+                    (gBaseName, (0, 0)),
+                    (gMarkName, self.getAnchorOffsets(baseGlyph, markGlyph))])
                 # set the advanced width
                 dfltSidebearings = self.upm * .05  # 5% of UPM
                 newGlyph.leftMargin = (dfltSidebearings +
@@ -473,7 +736,7 @@ class AdjustAnchors(BaseWindowController):
                 glyphsList.extend(self.extraGlyphsList)
                 glyphsList.append(newLine)
 
-        # update the contents of the MultiLineView
+        # update the contents of the line view
         self.w.lineView.set(glyphsList)
 
     def updateExtensionWindow(self):
@@ -495,9 +758,18 @@ class AdjustAnchors(BaseWindowController):
                 self.w.lineView.set(
                     self.glyphPreviewCacheDict[currentGlyphName])
 
+            # stacks of marks on the base glyph
+            elif (self.markStackDepth > 1 and
+                    currentGlyphName not in self.marksDict):
+                glyphsList = self.makeMarkStackGlyphs(currentGlyphName)
+                self.w.lineView.set(glyphsList)
+                self.glyphPreviewCacheDict[currentGlyphName] = glyphsList
+
             # assemble the glyphs
             else:
                 glyphsList = []
+                # key: glyph name -- value: name of a missing component
+                missingNamesDict = {}
                 for glyphNameInUIList in self.glyphNamesList:
                     # trim the contextual portion of the UI glyph name
                     # and keep track of it
@@ -510,22 +782,16 @@ class AdjustAnchors(BaseWindowController):
                     else:
                         glyphNameCXTportion = ''
 
-                    newGlyph = RGlyph()
-                    if self.rf3:
-                        newGlyph.layer = self.layer
-                    else:
-                        newGlyph.font = newGlyph.getParent()
-
                     # the glyph in the UI list is a mark
                     if glyphNameInUIList in self.marksDict:
                         markGlyph = self.font[glyphNameInUIList]
 
-                        # append base glyph
-                        newGlyph = self.deepAppendGlyph(newGlyph, self.glyph)
-                        # append mark glyph
-                        newGlyph = self.deepAppendGlyph(
-                            newGlyph, markGlyph, self.getAnchorOffsets(
-                                self.glyph, markGlyph, glyphNameCXTportion))
+                        # base glyph, and mark glyph shifted
+                        # by the anchors' offset
+                        newGlyph = self.newPreviewGlyph([
+                            (currentGlyphName, (0, 0)),
+                            (glyphNameInUIList, self.getAnchorOffsets(
+                                self.glyph, markGlyph, glyphNameCXTportion))])
 
                         # set the advanced width
                         # combining marks or other glyphs with
@@ -540,12 +806,12 @@ class AdjustAnchors(BaseWindowController):
                     else:
                         baseGlyph = self.font[glyphNameInUIList]
 
-                        # append base glyph
-                        newGlyph = self.deepAppendGlyph(newGlyph, baseGlyph)
-                        # append mark glyph
-                        newGlyph = self.deepAppendGlyph(
-                            newGlyph, self.glyph, self.getAnchorOffsets(
-                                baseGlyph, self.glyph))
+                        # base glyph, and mark glyph shifted
+                        # by the anchors' offset
+                        newGlyph = self.newPreviewGlyph([
+                            (glyphNameInUIList, (0, 0)),
+                            (currentGlyphName, self.getAnchorOffsets(
+                                baseGlyph, self.glyph))])
 
                         # set the advanced width
                         # combining marks or other glyphs with
@@ -566,16 +832,11 @@ class AdjustAnchors(BaseWindowController):
                         newGlyph.leftMargin += self.extraSidebearings[0]
                         newGlyph.rightMargin += self.extraSidebearings[1]
 
-                    # one last check for making sure the new glyph
-                    # can be displayed
-                    if not newGlyph.components:
-                        glyphsList.extend(self.extraGlyphsList)
-                        glyphsList.append(newGlyph)
-                    else:
-                        print("Combination with mark glyph %s can't be "
-                              "previewed because it contains component %s." %
-                              (glyphNameInUIList + glyphNameCXTportion,
-                               newGlyph.components[0].baseGlyph))
+                    self.warnMissingComponents(
+                        [currentGlyphName, glyphNameInUIList],
+                        missingNamesDict)
+                    glyphsList.extend(self.extraGlyphsList)
+                    glyphsList.append(newGlyph)
 
                 glyphsList.extend(self.extraGlyphsList)
                 self.w.lineView.set(glyphsList)
@@ -585,6 +846,46 @@ class AdjustAnchors(BaseWindowController):
         else:
             self.w.lineView.set([])
 
+    def makeMarkStackGlyphs(self, baseName):
+        """
+        Returns the list of glyphs previewing the stacks of marks on the
+        base glyph. Only the stacks that are previewed are assembled.
+        """
+        glyphsList = []
+        # key: glyph name -- value: name of a missing component
+        missingNamesDict = {}
+        baseWidth = self.font[baseName].width
+        stacks = self.markStackAssembler.iterStackParts(
+            baseName, self.markStackDepth)
+        # one more than the limit, to tell if some stacks are left out
+        stacksList = list(islice(stacks, MAX_MARK_STACKS + 1))
+        if len(stacksList) > MAX_MARK_STACKS:
+            del stacksList[MAX_MARK_STACKS:]
+            print("WARNING: Only %d of the stacks of marks on %s are "
+                  "previewed, taking turns between the marks attached "
+                  "to it." % (MAX_MARK_STACKS, baseName))
+        for chain, partsList in stacksList:
+            newGlyph = self.newPreviewGlyph(partsList, baseWidth)
+            # combining marks or other glyphs with
+            # a small advanced width
+            if baseWidth < 10:
+                newGlyph.leftMargin = self.upm * .05  # 5% of UPM
+                newGlyph.rightMargin = newGlyph.leftMargin
+            # pad the new glyph if it has too much overhang
+            if newGlyph.leftMargin < self.upm * .15:
+                newGlyph.leftMargin = self.upm * .05
+            if newGlyph.rightMargin < self.upm * .15:
+                newGlyph.rightMargin = self.upm * .05
+            newGlyph.leftMargin += self.extraSidebearings[0]
+            newGlyph.rightMargin += self.extraSidebearings[1]
+
+            self.warnMissingComponents(chain, missingNamesDict)
+            glyphsList.extend(self.extraGlyphsList)
+            glyphsList.append(newGlyph)
+
+        glyphsList.extend(self.extraGlyphsList)
+        return glyphsList
+
     def listSelectionCallback(self, sender):
         selectedGlyphNamesList = []
         for index in sender.getSelection():
@@ -598,107 +899,30 @@ class AdjustAnchors(BaseWindowController):
     def fillAnchorsAndMarksDicts(self):
         # reset all the dicts
         self.glyphPreviewCacheDict.clear()
-        self.anchorsOnMarksDict.clear()
-        self.anchorsOnBasesDict.clear()
-        self.CXTanchorsOnBasesDict.clear()
-        self.marksDict.clear()
-        markGlyphsWithMoreThanOneAnchorTypeList = []
-
-        for glyphName in self.font.glyphOrder:
-            glyphAnchorsList = self.font[glyphName].anchors
-            for anchor in glyphAnchorsList:
-                if anchor.name[0] == '_':
-                    anchorName = anchor.name[1:]
-                    # add to AnchorsOnMarks dictionary
-                    if anchorName not in self.anchorsOnMarksDict:
-                        self.anchorsOnMarksDict[anchorName] = [glyphName]
-                    else:
-                        tempList = self.anchorsOnMarksDict[anchorName]
-                        tempList.append(glyphName)
-                        self.anchorsOnMarksDict[anchorName] = tempList
-                    # add to Marks dictionary
-                    if glyphName not in self.marksDict:
-                        self.marksDict[glyphName] = anchorName
-                    else:
-                        if (glyphName not in
-                                markGlyphsWithMoreThanOneAnchorTypeList):
-                            markGlyphsWithMoreThanOneAnchorTypeList.append(
-                                glyphName)
-                else:
-                    anchorName = anchor.name
-                    if CONTEXTUAL_ANCHOR_TAG in anchorName:
-                        # add to AnchorsOnBases dictionary
-                        if anchorName not in self.CXTanchorsOnBasesDict:
-                            self.CXTanchorsOnBasesDict[anchorName] = [
-                                glyphName]
-                        else:
-                            tempList = self.CXTanchorsOnBasesDict[anchorName]
-                            tempList.append(glyphName)
-                            self.CXTanchorsOnBasesDict[anchorName] = tempList
-                    else:
-                        # add to AnchorsOnBases dictionary
-                        if anchorName not in self.anchorsOnBasesDict:
-                            self.anchorsOnBasesDict[anchorName] = [glyphName]
-                        else:
-                            tempList = self.anchorsOnBasesDict[anchorName]
-                            tempList.append(glyphName)
-                            self.anchorsOnBasesDict[anchorName] = tempList
-
-        if markGlyphsWithMoreThanOneAnchorTypeList:
-            for glyphName in markGlyphsWithMoreThanOneAnchorTypeList:
-                print("ERROR: Glyph %s has more than one type of anchor." %
-                      glyphName)
+        # the Output Window was cleared, or the font changed
+        self.warnedGlyphNamesSet.clear()
+        # the index empties and refills its dicts in place
+        self.anchorIndex.fill(self.font)
+        # the cached stacks are out of date
+        self.markStackAssembler.font = self.font
+        self.markStackAssembler.clear()
+        index = self.anchorIndex
+        for glyphName in index.markGlyphsWithMoreThanOneAnchorTypeList:
+            print("ERROR: Glyph %s has more than one type of anchor." %
+                  glyphName)
 
     def makeGlyphNamesList(self, glyph):
         glyphNamesList = []
-        markGlyphIsAbleToBeBase = False
         # NOTE: "if glyph" will return zero (its length),
         # so "is not None" is necessary
         if glyph is not None:
             # assemble the list for the UI list
-            for anchor in glyph.anchors:
-                anchorName = anchor.name
-                # the glyph selected is a base
-                if anchorName in self.anchorsOnMarksDict:
-                    glyphNamesList.extend(self.anchorsOnMarksDict[anchorName])
-                # the glyph selected is a mark
-                # skips the leading underscore
-                elif anchorName[1:] in self.anchorsOnBasesDict:
-                    glyphNamesList.extend(
-                        self.anchorsOnBasesDict[anchorName[1:]])
-                # the glyph selected is a base
-                elif anchorName[0] != '_' and (
-                        anchorName in self.CXTanchorsOnBasesDict):
-                    cxtTagIndex = anchorName.find(CONTEXTUAL_ANCHOR_TAG)
-                    anchorNameNOTCXTportion = anchorName[:cxtTagIndex]
-                    anchorNameCXTportion = anchorName[cxtTagIndex:]
-                    # XXX here only the first mark glyph that has an anchor of
-                    # the kind 'anchorNameNOTCXTportion' is considered.
-                    # This is probably harmless, but...
-                    glyphName = '%s%s' % (
-                        self.anchorsOnMarksDict[anchorNameNOTCXTportion][0],
-                        anchorNameCXTportion)
-                    glyphNamesList.append(glyphName)
-
-            # for mark glyphs, test if they're able to get
-            # other mark glyphs attached to them.
-            # this will (correctly) prevent the UI list from including
-            # glyph names that cannot be displayed with the current glyph
-            if glyph.name in self.marksDict:
-                for anchor in glyph.anchors:
-                    # the current mark glyph has anchors that
-                    # allow it to be a base for other marks
-                    if anchor.name[0] != '_':
-                        markGlyphIsAbleToBeBase = True
-                        break
-                # remove marks from the glyph list if the
-                # current mark glyph can't work as a base
-                if not markGlyphIsAbleToBeBase:
-                    # iterate from the end of the list
-                    for glyphName in glyphNamesList[::-1]:
-                        if glyphName in self.marksDict:
-                            glyphNamesList.remove(glyphName)
+            glyphNamesList = self.anchorIndex.getPreviewNames(glyph)
         glyphOrder = self.font.glyphOrder
+        if self.combinationFrequencies is not None and glyph is not None:
+            # the most frequent combinations first
+            return self.combinationFrequencies.sortPreviewNames(
+                glyph.name, glyphNamesList, self.marksDict, glyphOrder)
         glyphNamesList = sorted(
             glyphNamesList, key=lambda gn: glyphOrder.index(gn))
         return glyphNamesList
@@ -708,78 +932,28 @@ class AdjustAnchors(BaseWindowController):
 
     def getAnchorOffsets(self, canvasGlyph, glyphToDraw,
                          anchorNameCXTportion=''):
-        # the current glyph is a mark
-        if canvasGlyph.name in self.marksDict:
-            # glyphToDraw is also a mark (mark-to-mark case)
-            if glyphToDraw.name in self.marksDict:
-                # pick the (mark glyph) anchor to draw on
-                for anchor in canvasGlyph.anchors:
-                    if anchor.name[0] != '_':
-                        anchorName = anchor.name
-                        markAnchor = anchor
-                        break
-                # pick the (base glyph) anchor to draw on
-                for anchor in glyphToDraw.anchors:
-                    try:
-                        if anchor.name == '_' + anchorName:
-                            baseAnchor = anchor
-                            break
-                    except UnboundLocalError:
-                        continue
-            # glyphToDraw is not a mark
-            else:
-                # pick the (mark glyph) anchor to draw on
-                for anchor in canvasGlyph.anchors:
-                    if anchor.name[0] == '_':
-                        anchorName = anchor.name[1:]
-                        markAnchor = anchor
-                        break
-                # pick the (base glyph) anchor to draw on
-                for anchor in glyphToDraw.anchors:
-                    try:
-                        if anchor.name == anchorName:
-                            baseAnchor = anchor
-                            break
-                    except UnboundLocalError:
-                        continue
-
-            try:
-                offsetX = markAnchor.x - baseAnchor.x
-                offsetY = markAnchor.y - baseAnchor.y
-            except UnboundLocalError:
-                offsetX = 0
-                offsetY = 0
-
-        # the current glyph is a base
-        else:
-            try:
-                anchorName = self.marksDict[glyphToDraw.name]
-            except KeyError:
-                anchorName = None
-
-            if anchorName:
-                # pick the (base glyph) anchor to draw on
-                for anchor in canvasGlyph.anchors:
-                    if anchor.name == anchorName + anchorNameCXTportion:
-                        baseAnchor = anchor
-                        break
-                # pick the (mark glyph) anchor to draw on
-                for anchor in glyphToDraw.anchors:
-                    if anchor.name == '_' + anchorName:
-                        markAnchor = anchor
-                        break
-
-            try:
-                offsetX = baseAnchor.x - markAnchor.x
-                offsetY = baseAnchor.y - markAnchor.y
-            except UnboundLocalError:
-                offsetX = 0
-                offsetY = 0
+        return self.anchorIndex.getAnchorOffsets(
+            canvasGlyph, glyphToDraw, anchorNameCXTportion)
 
-        return (offsetX, offsetY)
+    def _drawAnchorBatchPreview(self, info):
+        """ draw the new position of the current glyph's anchor """
+        if self.anchorBatchPreview is None or self.glyph is None:
+            return
+        anchorName, positionsDict = self.anchorBatchPreview
+        if self.glyph.name not in positionsDict:
+            return
+        (oldX, oldY), (newX, newY) = positionsDict[self.glyph.name]
+        radius = 5 * info["scale"]
+        fill(None)
+        stroke(1, 0, 0, self.Alpha)
+        strokeWidth(info["scale"])
+        line((oldX, oldY), (newX, newY))
+        oval(newX - radius, newY - radius, radius * 2, radius * 2)
+        stroke(None)
 
     def _drawGlyphs(self, info):
         """ draw stuff in the glyph window view """
+        self._drawAnchorBatchPreview(info)
         translateBefore = (0, 0)
 
         for glyphName in self.selectedGlyphNamesList:
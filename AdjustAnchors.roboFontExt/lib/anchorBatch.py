@@ -0,0 +1,120 @@
+# Copyright 2015 Adobe. All rights reserved.
+
+"""
+Apply one transformation to an anchor class across many glyphs at once.
+
+The new positions are computed first (computeAnchorPositions), and then
+written to the font (applyAnchorPositions) inside a single held-notification
+transaction, so that Font.Changed is posted once per batch instead of once
+per anchor edit.
+"""
+
+MOVE_MODE = "move"
+ALIGN_MODE = "align"
+
+BATCH_MODES = [MOVE_MODE, ALIGN_MODE]
+
+# "baseline" is not an attribute of font.info, it's always zero
+VERTICAL_METRICS = ["baseline", "xHeight", "capHeight", "ascender",
+                    "descender"]
+
+
+def getGlyphAnchor(glyph, anchorName):
+    # NOTE: if a glyph has more than one anchor with the same name,
+    # only the first one is considered
+    for anchor in glyph.anchors:
+        if anchor.name == anchorName:
+            return anchor
+    return None
+
+
+def getVerticalMetric(font, metricName):
+    if metricName == "baseline":
+        return 0
+    value = getattr(font.info, metricName, None)
+    if value is None:
+        return 0
+    return value
+
+
+def getAnchorClassGlyphNames(font, anchorName):
+    """
+    Returns the names of the glyphs that have an anchor named anchorName,
+    in the font's glyph order.
+    """
+    glyphNamesList = []
+    for glyphName in font.glyphOrder:
+        if glyphName not in font:
+            continue
+        if getGlyphAnchor(font[glyphName], anchorName) is not None:
+            glyphNamesList.append(glyphName)
+    return glyphNamesList
+
+
+def computeAnchorPositions(font, glyphNamesList, anchorName, mode,
+                           delta=(0, 0), metricName="baseline"):
+    """
+    Returns a dictionary -- key: glyph name -- value: tuple containing the
+    current and the new position of the anchor. Glyphs that don't have the
+    anchor, and anchors that wouldn't move, are left out.
+    The font is not modified.
+    """
+    if mode not in BATCH_MODES:
+        raise ValueError("Unknown batch mode: %r" % mode)
+    deltaX, deltaY = delta
+    metricY = getVerticalMetric(font, metricName)
+    positionsDict = {}
+
+    for glyphName in glyphNamesList:
+        if glyphName not in font:
+            continue
+        glyph = font[glyphName]
+        anchor = getGlyphAnchor(glyph, anchorName)
+        if anchor is None:
+            continue
+        oldPosition = (anchor.x, anchor.y)
+
+        if mode == MOVE_MODE:
+            newPosition = (anchor.x + deltaX, anchor.y + deltaY)
+        else:  # ALIGN_MODE
+            newPosition = (anchor.x + deltaX, metricY + deltaY)
+
+        if newPosition != oldPosition:
+            positionsDict[glyphName] = (oldPosition, newPosition)
+    return positionsDict
+
+
+def applyAnchorPositions(font, anchorName, positionsDict):
+    """
+    Moves the anchors to the new positions computed by computeAnchorPositions.
+    The anchors which are no longer at their old position (e.g. they were
+    edited after the batch was computed) are left alone. All the
+    notifications are held until the whole batch is applied.
+    Returns a dictionary in the same format as positionsDict, that undoes
+    the batch when it's passed to this function, and the list of the names
+    of the glyphs that were skipped.
+    """
+    undoPositionsDict = {}
+    skippedNamesList = []
+    # a fontParts font wraps a defcon font
+    if hasattr(font, "naked"):
+        nakedFont = font.naked()
+    else:
+        nakedFont = font
+    nakedFont.holdNotifications()
+    try:
+        for glyphName, (oldPosition, newPosition) in positionsDict.items():
+            if glyphName not in font:
+                continue
+            anchor = getGlyphAnchor(font[glyphName], anchorName)
+            if anchor is None:
+                continue
+            currentPosition = (anchor.x, anchor.y)
+            if currentPosition != tuple(oldPosition):
+                skippedNamesList.append(glyphName)
+                continue
+            anchor.x, anchor.y = newPosition
+            undoPositionsDict[glyphName] = (newPosition, currentPosition)
+    finally:
+        nakedFont.releaseHeldNotifications()
+    return undoPositionsDict, sorted(skippedNamesList)
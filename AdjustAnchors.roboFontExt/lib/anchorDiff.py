@@ -0,0 +1,234 @@
+# Copyright 2015 Adobe. All rights reserved.
+
+"""
+Headless diff of the base + mark attachments of two revisions of a UFO.
+
+Only the .glif files whose content differs between the two UFOs are read
+again, and only the combinations that involve those glyphs are compared.
+The report is ranked by how far the marks moved, and the changed pairs can
+be proofed side by side (previous revision in gray, current one in black),
+with the rows listed in a JSON lines file next to the image (changes.jsonl):
+
+    python anchorDiff.py old/Regular.ufo Regular.ufo --proof changes.png
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+
+from anchorIndex import AnchorIndex, splitContextualName
+from glyphRecords import readGlyphRecords
+
+MOVED = "moved"
+ADDED = "added"
+REMOVED = "removed"
+# the combination exists, but one of the anchors is missing
+BROKEN = "broken"
+FIXED = "fixed"
+
+
+def getChangedGlyphNames(oldRecords, newRecords):
+    return set(
+        glyphName for glyphName in set(oldRecords) | set(newRecords)
+        if oldRecords.hashesDict.get(glyphName) !=
+        newRecords.hashesDict.get(glyphName))
+
+
+def iterGlyphCombinations(records, index, glyphName):
+    """
+    Yields the (canvas glyph name, combined glyph name) pairs of the
+    combinations that involve the glyph. The combined glyph is always a
+    mark (mirrored mark + base pairs are left out), and its name includes
+    the contextual portion, if any.
+    """
+    if glyphName not in records:
+        return
+    glyph = records[glyphName]
+    for previewName in index.getPreviewNames(glyph):
+        if splitContextualName(previewName)[0] in index.marksDict:
+            yield glyphName, previewName
+        if glyphName in index.marksDict:
+            yield previewName, glyphName
+    # contextual combinations only list the first mark of the class
+    if glyphName in index.marksDict:
+        for anchorName, baseNamesList in index.CXTanchorsOnBasesDict.items():
+            anchorNameNOTCXTportion, anchorNameCXTportion = (
+                splitContextualName(anchorName))
+            marksList = index.anchorsOnMarksDict.get(
+                anchorNameNOTCXTportion, [])
+            if marksList and marksList[0] == glyphName:
+                for baseName in baseNamesList:
+                    yield baseName, glyphName + anchorNameCXTportion
+
+
+def getCombinationOffset(records, index, canvasName, previewName):
+    """
+    Returns the offset of the combination, or None if one of
+    the glyphs or one of the anchors is missing.
+    """
+    glyphName, anchorNameCXTportion = splitContextualName(previewName)
+    if canvasName not in records or glyphName not in records:
+        return None
+    canvasAnchor, drawAnchor = index.getAttachmentAnchors(
+        records[canvasName], records[glyphName], anchorNameCXTportion)
+    if canvasAnchor is None or drawAnchor is None:
+        return None
+    return (canvasAnchor.x - drawAnchor.x, canvasAnchor.y - drawAnchor.y)
+
+
+def diffRecords(oldRecords, newRecords):
+    """
+    Returns the list of the combinations whose offset changed, as dicts,
+    ranked by how much they changed.
+    """
+    oldIndex = AnchorIndex(oldRecords)
+    newIndex = AnchorIndex(newRecords)
+    combinationsSet = set()
+    for glyphName in getChangedGlyphNames(oldRecords, newRecords):
+        combinationsSet.update(
+            iterGlyphCombinations(oldRecords, oldIndex, glyphName))
+        combinationsSet.update(
+            iterGlyphCombinations(newRecords, newIndex, glyphName))
+
+    changesList = []
+    for canvasName, previewName in combinationsSet:
+        oldOffset = getCombinationOffset(
+            oldRecords, oldIndex, canvasName, previewName)
+        newOffset = getCombinationOffset(
+            newRecords, newIndex, canvasName, previewName)
+        if oldOffset == newOffset:
+            continue
+        change = {"base": canvasName, "mark": previewName,
+                  "old": oldOffset, "new": newOffset}
+        if oldOffset is not None and newOffset is not None:
+            change["status"] = MOVED
+            change["shift"] = (newOffset[0] - oldOffset[0],
+                               newOffset[1] - oldOffset[1])
+            change["distance"] = math.hypot(*change["shift"])
+        else:
+            if oldOffset is None:
+                bothExist = (canvasName in oldRecords and
+                             splitContextualName(previewName)[0] in
+                             oldRecords)
+                change["status"] = FIXED if bothExist else ADDED
+            else:
+                bothExist = (canvasName in newRecords and
+                             splitContextualName(previewName)[0] in
+                             newRecords)
+                change["status"] = BROKEN if bothExist else REMOVED
+            change["shift"] = None
+            change["distance"] = None
+        changesList.append(change)
+
+    # the combinations that appeared, disappeared or broke come first,
+    # then the ones that moved the most
+    changesList.sort(key=lambda change: (
+        change["distance"] is not None, -(change["distance"] or 0),
+        change["base"], change["mark"]))
+    return changesList
+
+
+def diffUFOs(oldPath, newPath):
+    oldRecords = readGlyphRecords(oldPath)
+    newRecords = readGlyphRecords(newPath, oldRecords)
+    return diffRecords(oldRecords, newRecords)
+
+
+def renderProofs(oldPath, newPath, changesList, pointSize=72, margin=10):
+    """
+    Returns an RGBA canvas with the changed combinations side by side, one
+    per row: the previous revision in gray, and the current one in black.
+    """
+    import numpy as np
+    from defcon import Font
+    from previewGlyphs import newPreviewGlyph
+    from rasterTiles import TileCache, blitTile
+
+    tileCache = TileCache()
+    columnsList = [(Font(oldPath), "old", (0.6, 0.6, 0.6, 1)),
+                   (Font(newPath), "new", (0, 0, 0, 1))]
+    rowsList = []
+    for change in changesList:
+        glyphName = splitContextualName(change["mark"])[0]
+        tilesList = []
+        for font, offsetKey, fillStyle in columnsList:
+            offset = change[offsetKey]
+            if offset is None:
+                tilesList.append(None)
+                continue
+            layer = font.layers.defaultLayer
+            partsList = [(change["base"], (0, 0)), (glyphName, offset)]
+            previewGlyph = newPreviewGlyph(
+                layer, partsList, layer[change["base"]].width)
+            tilesList.append(tileCache.getCombinationTile(
+                previewGlyph, pointSize, fillStyle))
+        rowsList.append(tilesList)
+
+    tiles = [tile for tilesList in rowsList for tile in tilesList if tile]
+    if not tiles:
+        return np.ones((margin * 2, margin * 2, 4))
+    aboveBaseline = max(tile.originY for tile in tiles)
+    belowBaseline = max(tile.alpha.shape[0] - tile.originY for tile in tiles)
+    leftOfOrigin = max(tile.originX for tile in tiles)
+    columnWidth = leftOfOrigin + max(
+        tile.alpha.shape[1] - tile.originX for tile in tiles) + margin
+    rowHeight = aboveBaseline + belowBaseline + margin
+    canvas = np.ones((margin + rowHeight * len(rowsList),
+                      margin + columnWidth * len(columnsList), 4))
+    for rowIndex, tilesList in enumerate(rowsList):
+        for columnIndex, tile in enumerate(tilesList):
+            if tile is not None:
+                blitTile(canvas, tile,
+                         margin + columnWidth * columnIndex + leftOfOrigin,
+                         margin + rowHeight * rowIndex + aboveBaseline)
+    return canvas
+
+
+def getProofIndexPath(proofPath):
+    return os.path.splitext(proofPath)[0] + ".jsonl"
+
+
+def writeProofIndex(path, changesList):
+    """
+    Writes the changes shown in the proof as JSON lines, with their row
+    number (starting at 1, from the top of the image).
+    """
+    with open(path, "w") as indexFile:
+        for row, change in enumerate(changesList, 1):
+            entry = dict(change, row=row)
+            indexFile.write(json.dumps(entry, sort_keys=True) + "\n")
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Compare the base + mark attachments of two UFOs, "
+                    "writing the changed combinations to stdout as JSON "
+                    "lines, the biggest changes first.")
+    parser.add_argument("old", metavar="OLD_UFO")
+    parser.add_argument("new", metavar="NEW_UFO")
+    parser.add_argument("--proof", metavar="PNG",
+                        help="write the changed combinations side by side, "
+                             "and their list (one JSON line per row) to a "
+                             ".jsonl file with the same name")
+    parser.add_argument("--limit", type=int, default=100,
+                        help="number of combinations in the proof "
+                             "(default: 100)")
+    parser.add_argument("--point-size", type=int, default=72)
+    options = parser.parse_args(args)
+
+    changesList = diffUFOs(options.old, options.new)
+    for change in changesList:
+        sys.stdout.write(json.dumps(change, sort_keys=True) + "\n")
+    if options.proof:
+        from rasterTiles import writePNG
+        proofChangesList = changesList[:options.limit]
+        writePNG(options.proof, renderProofs(
+            options.old, options.new, proofChangesList, options.point_size))
+        writeProofIndex(getProofIndexPath(options.proof), proofChangesList)
+    return 1 if changesList else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
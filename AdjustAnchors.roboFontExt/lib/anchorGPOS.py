@@ -0,0 +1,361 @@
+# Copyright 2015 Adobe. All rights reserved.
+
+"""
+Headless check of the mark attachments compiled in the GPOS table of an
+OTF or TTF against the anchors of its UFO source.
+
+The MarkBase and MarkMark subtables are read into arrays of offsets
+(base x mark), which are compared with the same arrays computed from the
+UFO's anchors; no pair is shaped. The mismatches are written to stdout as
+JSON lines:
+
+    python anchorGPOS.py Regular.ufo Regular.otf
+"""
+
+import argparse
+import json
+import sys
+
+import numpy as np
+from fontTools.ttLib import TTFont
+from fontTools.ufoLib import UFOReader
+
+from anchorIndex import CONTEXTUAL_ANCHOR_TAG, AnchorIndex
+from glyphRecords import readGlyphRecords
+
+MARK_TO_BASE = "markToBase"
+MARK_TO_MARK = "markToMark"
+
+OFFSET_MISMATCH = "offsetMismatch"
+MISSING_IN_GPOS = "missingInGPOS"
+MISSING_IN_UFO = "missingInUFO"
+
+# GPOS lookup types
+MARK_BASE_LOOKUP = 4
+MARK_MARK_LOOKUP = 6
+EXTENSION_LOOKUP = 9
+
+# names of the attributes of the MarkBase and MarkMark subtables
+SUBTABLE_ATTRIBUTES = {
+    MARK_BASE_LOOKUP: ("MarkCoverage", "MarkArray", "BaseCoverage",
+                       "BaseArray", "BaseRecord", "BaseAnchor"),
+    MARK_MARK_LOOKUP: ("Mark1Coverage", "Mark1Array", "Mark2Coverage",
+                       "Mark2Array", "Mark2Record", "Mark2Anchor"),
+}
+
+
+class AttachmentGrid(object):
+    """
+    Offsets of the marks attached to the bases (or to other marks),
+    as an array of shape (bases, marks, 2). Undefined pairs are NaN.
+    """
+
+    def __init__(self, baseNamesList, markNamesList):
+        self.baseNamesList = baseNamesList
+        self.markNamesList = markNamesList
+        self.baseIndexDict = dict(
+            (glyphName, i) for i, glyphName in enumerate(baseNamesList))
+        self.markIndexDict = dict(
+            (glyphName, i) for i, glyphName in enumerate(markNamesList))
+        self.offsets = np.full(
+            (len(baseNamesList), len(markNamesList), 2), np.nan,
+            dtype=np.float32)
+
+    def getIndices(self, baseNamesList, markNamesList):
+        return (np.array([self.baseIndexDict[glyphName]
+                          for glyphName in baseNamesList], dtype=int),
+                np.array([self.markIndexDict[glyphName]
+                          for glyphName in markNamesList], dtype=int))
+
+    def fillUndefined(self, baseNamesList, markNamesList, offsets):
+        """
+        Sets the offsets (array of shape (bases, marks, 2)) of the pairs
+        that aren't defined yet; the first definition of a pair wins, like
+        the first subtable of a lookup that applies to it.
+        """
+        baseIndices, markIndices = self.getIndices(
+            baseNamesList, markNamesList)
+        block = np.ix_(baseIndices, markIndices)
+        currentOffsets = self.offsets[block]
+        undefined = np.isnan(currentOffsets)
+        currentOffsets[undefined] = offsets[undefined]
+        self.offsets[block] = currentOffsets
+
+    def update(self, otherGrid):
+        """
+        Overwrites the offsets with the ones defined in the other grid
+        (which has the same axes), like a later lookup attaching the mark
+        again.
+        """
+        defined = ~np.isnan(otherGrid.offsets[..., 0])
+        self.offsets[defined] = otherGrid.offsets[defined]
+
+
+def getFeatureLookupIndices(gpos):
+    """
+    Returns the set of the indices of the lookups listed in the features.
+    The lookups that are only reached thru contextual rules (e.g. the ones
+    of the contextual anchors) are left out.
+    """
+    if gpos.table.FeatureList is None:
+        return set()
+    return set(
+        lookupIndex
+        for featureRecord in gpos.table.FeatureList.FeatureRecord
+        for lookupIndex in featureRecord.Feature.LookupListIndex)
+
+
+def iterMarkSubtables(gpos, lookupType):
+    """
+    Yields the (lookup index, subtable) of the lookups of the given type
+    which are listed in the features, in lookup order (the subtables of
+    Extension lookups are unwrapped).
+    """
+    if gpos is None or gpos.table.LookupList is None:
+        return
+    featureLookupIndices = getFeatureLookupIndices(gpos)
+    for lookupIndex, lookup in enumerate(gpos.table.LookupList.Lookup):
+        if lookupIndex not in featureLookupIndices:
+            continue
+        for subtable in lookup.SubTable:
+            if lookup.LookupType == EXTENSION_LOOKUP:
+                if subtable.ExtensionLookupType != lookupType:
+                    continue
+                subtable = subtable.ExtSubTable
+            elif lookup.LookupType != lookupType:
+                continue
+            if subtable.Format == 1:
+                yield lookupIndex, subtable
+
+
+def getAnchorPosition(anchor):
+    if anchor is None:
+        return (np.nan, np.nan)
+    return (anchor.XCoordinate, anchor.YCoordinate)
+
+
+def readMarkSubtable(subtable, lookupType):
+    """
+    Returns the mark glyph names, the base glyph names, and the offsets of
+    every (base, mark) pair of the subtable (NaN where the base doesn't
+    have an anchor for the mark's class).
+    """
+    (markCoverage, markArray, baseCoverage, baseArray, baseRecordName,
+     baseAnchorName) = SUBTABLE_ATTRIBUTES[lookupType]
+    markNamesList = getattr(subtable, markCoverage).glyphs
+    baseNamesList = getattr(subtable, baseCoverage).glyphs
+    markRecords = getattr(subtable, markArray).MarkRecord
+    markClasses = np.array(
+        [record.Class for record in markRecords], dtype=int)
+    markPositions = np.array(
+        [getAnchorPosition(record.MarkAnchor) for record in markRecords],
+        dtype=np.float32).reshape(-1, 2)
+    # shape (bases, classes, 2)
+    baseAnchors = np.array(
+        [[getAnchorPosition(anchor)
+          for anchor in getattr(record, baseAnchorName)]
+         for record in getattr(getattr(subtable, baseArray), baseRecordName)],
+        dtype=np.float32).reshape(len(baseNamesList), subtable.ClassCount, 2)
+    offsets = baseAnchors[:, markClasses] - markPositions[None]
+    return markNamesList, baseNamesList, offsets
+
+
+def readGPOSAttachments(ttFont):
+    """
+    Returns a dict -- key: MARK_TO_BASE or MARK_TO_MARK -- value: list of
+    the lookups, in lookup order, each one being a list of the
+    (base names, mark names, offsets) tuples of its subtables.
+    """
+    gpos = ttFont["GPOS"] if "GPOS" in ttFont else None
+    attachmentsDict = {}
+    for attachmentType, lookupType in ((MARK_TO_BASE, MARK_BASE_LOOKUP),
+                                       (MARK_TO_MARK, MARK_MARK_LOOKUP)):
+        # key: lookup index -- value: list of the subtables' tuples
+        lookupsDict = {}
+        for lookupIndex, subtable in iterMarkSubtables(gpos, lookupType):
+            markNamesList, baseNamesList, offsets = readMarkSubtable(
+                subtable, lookupType)
+            lookupsDict.setdefault(lookupIndex, []).append(
+                (baseNamesList, markNamesList, offsets))
+        attachmentsDict[attachmentType] = [
+            lookupsDict[lookupIndex] for lookupIndex in sorted(lookupsDict)]
+    return attachmentsDict
+
+
+def readUFOAttachments(records, index, namesDict):
+    """
+    Computes the offsets of the UFO with the semantics of
+    AnchorIndex.getAnchorOffsets (contextual anchors are left out).
+    namesDict maps the UFO glyph names to the compiled glyph names.
+    Returns a dict in the format of readGPOSAttachments.
+    """
+    classNamesList = sorted(index.anchorsOnMarksDict)
+    classIndexDict = dict(
+        (anchorName, i) for i, anchorName in enumerate(classNamesList))
+    glyphNamesList = [glyphName for glyphName in records.glyphOrder
+                      if glyphName in namesDict]
+    # the first anchor of each class on each glyph
+    baseAnchors = np.full(
+        (len(glyphNamesList), len(classNamesList), 2), np.nan,
+        dtype=np.float32)
+    markPositions = np.full((len(glyphNamesList), 2), np.nan,
+                            dtype=np.float32)
+    markClasses = np.full(len(glyphNamesList), -1, dtype=int)
+    # the class of the first base anchor of the mark glyphs (mark-to-mark)
+    firstBaseClasses = np.full(len(glyphNamesList), -1, dtype=int)
+
+    for glyphIndex, glyphName in enumerate(glyphNamesList):
+        isMark = glyphName in index.marksDict
+        for anchor in records[glyphName].anchors:
+            if anchor.name[0] == '_':
+                if markClasses[glyphIndex] == -1:
+                    markClasses[glyphIndex] = classIndexDict[anchor.name[1:]]
+                    markPositions[glyphIndex] = (anchor.x, anchor.y)
+                continue
+            classIndex = classIndexDict.get(anchor.name, -1)
+            if isMark and firstBaseClasses[glyphIndex] == -1:
+                # -2: the first base anchor has no marks
+                firstBaseClasses[glyphIndex] = (
+                    classIndex if classIndex >= 0 else -2)
+            if (CONTEXTUAL_ANCHOR_TAG in anchor.name or classIndex == -1 or
+                    not np.isnan(baseAnchors[glyphIndex, classIndex, 0])):
+                continue
+            baseAnchors[glyphIndex, classIndex] = (anchor.x, anchor.y)
+
+    isMark = markClasses >= 0
+    marks = np.flatnonzero(isMark)
+    bases = np.flatnonzero(~isMark)
+    compiledNamesList = [namesDict[glyphName] for glyphName in glyphNamesList]
+    markNamesList = [compiledNamesList[i] for i in marks]
+
+    # shape (bases, marks, 2)
+    markToBaseOffsets = (baseAnchors[bases][:, markClasses[marks]] -
+                         markPositions[marks][None])
+    # the marks only attach to the first base anchor of the mark below
+    markToMarkOffsets = (baseAnchors[marks][:, markClasses[marks]] -
+                         markPositions[marks][None])
+    attachable = (firstBaseClasses[marks][:, None] ==
+                  markClasses[marks][None, :])
+    markToMarkOffsets[~attachable] = np.nan
+
+    return {
+        MARK_TO_BASE: [[([compiledNamesList[i] for i in bases],
+                         markNamesList, markToBaseOffsets)]],
+        MARK_TO_MARK: [[(markNamesList, markNamesList, markToMarkOffsets)]],
+    }
+
+
+def buildGrid(lookupsList, otherLookupsList):
+    """
+    Returns an AttachmentGrid of the lookups (in the format of
+    readGPOSAttachments), with the glyphs of both lists on its axes, so
+    that the grids of the two lists can be compared. Within a lookup the
+    first subtable that defines a pair wins, and a later lookup overrides
+    the earlier ones, as when the lookups are applied in order.
+    """
+    baseNamesSet, markNamesSet = set(), set()
+    for subtablesList in lookupsList + otherLookupsList:
+        for baseNamesList, markNamesList, offsets in subtablesList:
+            baseNamesSet.update(baseNamesList)
+            markNamesSet.update(markNamesList)
+    baseNamesList, markNamesList = sorted(baseNamesSet), sorted(markNamesSet)
+    grid = AttachmentGrid(baseNamesList, markNamesList)
+    for subtablesList in lookupsList:
+        lookupGrid = AttachmentGrid(baseNamesList, markNamesList)
+        for subtableAttachments in subtablesList:
+            lookupGrid.fillUndefined(*subtableAttachments)
+        grid.update(lookupGrid)
+    return grid
+
+
+def compareAttachments(gposAttachmentsDict, ufoAttachmentsDict,
+                       tolerance=0.5):
+    """
+    Yields the pairs whose offsets differ, as dicts.
+    """
+    for attachmentType in (MARK_TO_BASE, MARK_TO_MARK):
+        gposGrid = buildGrid(gposAttachmentsDict[attachmentType],
+                             ufoAttachmentsDict[attachmentType])
+        ufoGrid = buildGrid(ufoAttachmentsDict[attachmentType],
+                            gposAttachmentsDict[attachmentType])
+        gposOffsets, ufoOffsets = gposGrid.offsets, ufoGrid.offsets
+        inGPOS = ~np.isnan(gposOffsets[..., 0])
+        inUFO = ~np.isnan(ufoOffsets[..., 0])
+        with np.errstate(invalid="ignore"):
+            different = np.any(
+                np.abs(gposOffsets - ufoOffsets) > tolerance, axis=-1)
+        mismatches = ((inGPOS & inUFO & different) | (inGPOS != inUFO))
+        for baseIndex, markIndex in zip(*np.nonzero(mismatches)):
+            if not inGPOS[baseIndex, markIndex]:
+                check = MISSING_IN_GPOS
+            elif not inUFO[baseIndex, markIndex]:
+                check = MISSING_IN_UFO
+            else:
+                check = OFFSET_MISMATCH
+            gposOffset = gposOffsets[baseIndex, markIndex]
+            ufoOffset = ufoOffsets[baseIndex, markIndex]
+            yield {
+                "check": check,
+                "attachment": attachmentType,
+                "base": gposGrid.baseNamesList[baseIndex],
+                "mark": gposGrid.markNamesList[markIndex],
+                "gpos": (None if check == MISSING_IN_GPOS
+                         else gposOffset.tolist()),
+                "ufo": (None if check == MISSING_IN_UFO
+                        else ufoOffset.tolist()),
+            }
+
+
+def verifyFont(ufoPath, fontPath, tolerance=0.5):
+    """
+    Yields the mismatches between the UFO and the compiled font.
+    """
+    ttFont = TTFont(fontPath, lazy=True)
+    compiledNamesSet = set(ttFont.getGlyphOrder())
+    # the compiled font may use production glyph names
+    postscriptNamesDict = UFOReader(ufoPath, validate=False).readLib().get(
+        "public.postscriptNames", {})
+    records = readGlyphRecords(ufoPath)
+    namesDict = {}
+    for glyphName in records:
+        compiledName = postscriptNamesDict.get(glyphName, glyphName)
+        if compiledName in compiledNamesSet:
+            namesDict[glyphName] = compiledName
+    ufoNamesDict = dict(
+        (compiledName, glyphName)
+        for glyphName, compiledName in namesDict.items())
+
+    gposAttachmentsDict = readGPOSAttachments(ttFont)
+    ufoAttachmentsDict = readUFOAttachments(
+        records, AnchorIndex(records), namesDict)
+    for mismatch in compareAttachments(
+            gposAttachmentsDict, ufoAttachmentsDict, tolerance):
+        # report the names used in the UFO
+        mismatch["base"] = ufoNamesDict.get(mismatch["base"],
+                                            mismatch["base"])
+        mismatch["mark"] = ufoNamesDict.get(mismatch["mark"],
+                                            mismatch["mark"])
+        yield mismatch
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Compare the MarkBase and MarkMark attachments of a "
+                    "compiled font with the anchors of its UFO source, "
+                    "writing the mismatches to stdout as JSON lines.")
+    parser.add_argument("ufo", metavar="UFO")
+    parser.add_argument("font", metavar="OTF_OR_TTF")
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="largest difference considered a match, in "
+                             "font units (default: 0.5)")
+    options = parser.parse_args(args)
+
+    mismatchesCount = 0
+    for mismatch in verifyFont(options.ufo, options.font, options.tolerance):
+        sys.stdout.write(json.dumps(mismatch, sort_keys=True) + "\n")
+        mismatchesCount += 1
+    return 1 if mismatchesCount else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
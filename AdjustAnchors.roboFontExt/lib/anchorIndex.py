@@ -0,0 +1,188 @@
+# Copyright 2015 Adobe. All rights reserved.
+
+"""
+Index of the anchors of a font: which glyphs are marks, which anchor
+classes they attach to, and which glyphs have the matching base anchors.
+
+The index works with fontParts, robofab and defcon objects alike, so it's
+used by the extension as well as by the headless tools.
+"""
+
+# NOTE: Contextual anchors on mark glyphs are currently NOT supported
+CONTEXTUAL_ANCHOR_TAG = "CXT"
+
+
+def splitContextualName(name):
+    """
+    Returns the name without its contextual portion, and the contextual
+    portion (e.g. 'topCXT1' -> ('top', 'CXT1'); 'top' -> ('top', '')).
+    """
+    if CONTEXTUAL_ANCHOR_TAG in name:
+        cxtTagIndex = name.find(CONTEXTUAL_ANCHOR_TAG)
+        return name[:cxtTagIndex], name[cxtTagIndex:]
+    return name, ''
+
+
+def getNamedAnchors(glyph):
+    """
+    Returns the anchors of the glyph that have a name (UFO 3 allows
+    anchors without a name, which can't be part of an attachment).
+    """
+    return [anchor for anchor in glyph.anchors if anchor.name]
+
+
+class AnchorIndex(object):
+
+    def __init__(self, font=None):
+        # key: anchor name -- value: list of mark glyph names
+        self.anchorsOnMarksDict = {}
+        # key: anchor name -- value: list of base glyph names
+        self.anchorsOnBasesDict = {}
+        self.CXTanchorsOnBasesDict = {}
+        # key: mark glyph name -- value: anchor name
+        # NOTE: It's expected that each mark glyph only has one type of anchor
+        self.marksDict = {}
+        self.markGlyphsWithMoreThanOneAnchorTypeList = []
+        if font is not None:
+            self.fill(font)
+
+    def fill(self, font):
+        """
+        Empties the index and fills it with the anchors of the font.
+        The dicts are emptied in place, so references to them stay valid.
+        """
+        self.anchorsOnMarksDict.clear()
+        self.anchorsOnBasesDict.clear()
+        self.CXTanchorsOnBasesDict.clear()
+        self.marksDict.clear()
+        del self.markGlyphsWithMoreThanOneAnchorTypeList[:]
+
+        for glyphName in font.glyphOrder:
+            if glyphName not in font:
+                continue
+            for anchor in getNamedAnchors(font[glyphName]):
+                if anchor.name[0] == '_':
+                    anchorName = anchor.name[1:]
+                    # add to AnchorsOnMarks dictionary
+                    self.anchorsOnMarksDict.setdefault(
+                        anchorName, []).append(glyphName)
+                    # add to Marks dictionary
+                    if glyphName not in self.marksDict:
+                        self.marksDict[glyphName] = anchorName
+                    elif (glyphName not in
+                            self.markGlyphsWithMoreThanOneAnchorTypeList):
+                        self.markGlyphsWithMoreThanOneAnchorTypeList.append(
+                            glyphName)
+                elif CONTEXTUAL_ANCHOR_TAG in anchor.name:
+                    self.CXTanchorsOnBasesDict.setdefault(
+                        anchor.name, []).append(glyphName)
+                else:
+                    self.anchorsOnBasesDict.setdefault(
+                        anchor.name, []).append(glyphName)
+
+    def getPreviewNames(self, glyph):
+        """
+        Returns the names of the glyphs that can be combined with the glyph,
+        as listed in the extension's UI list (unsorted). The names of
+        contextual combinations include the contextual portion.
+        """
+        glyphNamesList = []
+        anchorsList = getNamedAnchors(glyph)
+        for anchor in anchorsList:
+            anchorName = anchor.name
+            # the glyph selected is a base
+            if anchorName in self.anchorsOnMarksDict:
+                glyphNamesList.extend(self.anchorsOnMarksDict[anchorName])
+            # the glyph selected is a mark
+            # skips the leading underscore
+            elif anchorName[1:] in self.anchorsOnBasesDict:
+                glyphNamesList.extend(
+                    self.anchorsOnBasesDict[anchorName[1:]])
+            # the glyph selected is a base
+            elif anchorName[0] != '_' and (
+                    anchorName in self.CXTanchorsOnBasesDict):
+                anchorNameNOTCXTportion, anchorNameCXTportion = (
+                    splitContextualName(anchorName))
+                # contextual anchors without marks can't be previewed
+                if anchorNameNOTCXTportion not in self.anchorsOnMarksDict:
+                    continue
+                # XXX here only the first mark glyph that has an anchor of
+                # the kind 'anchorNameNOTCXTportion' is considered.
+                # This is probably harmless, but...
+                glyphNamesList.append('%s%s' % (
+                    self.anchorsOnMarksDict[anchorNameNOTCXTportion][0],
+                    anchorNameCXTportion))
+
+        # for mark glyphs, test if they're able to get
+        # other mark glyphs attached to them.
+        # this will (correctly) prevent the UI list from including
+        # glyph names that cannot be displayed with the current glyph
+        if glyph.name in self.marksDict:
+            # the current mark glyph has anchors that
+            # allow it to be a base for other marks
+            markGlyphIsAbleToBeBase = any(
+                anchor.name[0] != '_' for anchor in anchorsList)
+            # remove marks from the glyph list if the
+            # current mark glyph can't work as a base
+            if not markGlyphIsAbleToBeBase:
+                glyphNamesList = [
+                    glyphName for glyphName in glyphNamesList
+                    if glyphName not in self.marksDict]
+        return glyphNamesList
+
+    def getAttachmentAnchors(self, canvasGlyph, glyphToDraw,
+                             anchorNameCXTportion=''):
+        """
+        Returns the two anchors that attach glyphToDraw to canvasGlyph, as
+        a (canvasGlyph anchor, glyphToDraw anchor) tuple. Either of them is
+        None when the glyphs don't have the matching anchors.
+        """
+        canvasAnchor = drawAnchor = None
+        # the current glyph is a mark
+        if canvasGlyph.name in self.marksDict:
+            # when glyphToDraw is also a mark (mark-to-mark case) it's
+            # attached to the first base anchor of the current glyph,
+            # otherwise the first mark anchor of the current glyph is
+            # attached to glyphToDraw
+            toDrawIsMark = glyphToDraw.name in self.marksDict
+            for anchor in getNamedAnchors(canvasGlyph):
+                if (anchor.name[0] != '_') == toDrawIsMark:
+                    canvasAnchor = anchor
+                    break
+            if canvasAnchor is not None:
+                if toDrawIsMark:
+                    drawAnchorName = '_' + canvasAnchor.name
+                else:
+                    drawAnchorName = canvasAnchor.name[1:]
+                for anchor in glyphToDraw.anchors:
+                    if anchor.name == drawAnchorName:
+                        drawAnchor = anchor
+                        break
+
+        # the current glyph is a base
+        else:
+            anchorName = self.marksDict.get(glyphToDraw.name)
+            if anchorName:
+                # pick the (base glyph) anchor to draw on
+                for anchor in canvasGlyph.anchors:
+                    if anchor.name == anchorName + anchorNameCXTportion:
+                        canvasAnchor = anchor
+                        break
+                # pick the (mark glyph) anchor to draw on
+                for anchor in glyphToDraw.anchors:
+                    if anchor.name == '_' + anchorName:
+                        drawAnchor = anchor
+                        break
+        return canvasAnchor, drawAnchor
+
+    def getAnchorOffsets(self, canvasGlyph, glyphToDraw,
+                         anchorNameCXTportion=''):
+        """
+        Returns the (x, y) offset by which glyphToDraw must be shifted to
+        be attached to canvasGlyph; (0, 0) when an anchor is missing.
+        """
+        canvasAnchor, drawAnchor = self.getAttachmentAnchors(
+            canvasGlyph, glyphToDraw, anchorNameCXTportion)
+        if canvasAnchor is None or drawAnchor is None:
+            return (0, 0)
+        return (canvasAnchor.x - drawAnchor.x, canvasAnchor.y - drawAnchor.y)
@@ -0,0 +1,271 @@
+# Copyright 2015 Adobe. All rights reserved.
+
+"""
+Headless quality check of the anchors of one or many UFOs.
+
+The findings are written to stdout as JSON lines while the fonts are being
+scanned (one process per font), e.g.
+
+    python anchorQA.py Regular.ufo Bold.ufo > findings.jsonl
+"""
+
+from functools import partial
+from queue import Empty
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+
+from defcon import Font
+
+from anchorIndex import AnchorIndex, splitContextualName
+
+# checks
+DUPLICATE_ANCHOR = "duplicateAnchor"
+UNNAMED_ANCHOR = "unnamedAnchor"
+MULTIPLE_MARK_ANCHORS = "multipleMarkAnchors"
+MISSING_COMPONENT = "missingComponent"
+ORPHAN_MARK_CLASS = "orphanMarkClass"
+BASE_WITHOUT_MARKS = "baseWithoutMarks"
+CONTEXTUAL_WITHOUT_CLASS = "contextualWithoutClass"
+MISSING_ANCHOR_OFFSET = "missingAnchorOffset"
+FONT_ERROR = "fontError"
+
+ERROR = "error"
+WARNING = "warning"
+
+# messages of the scanning processes (the findings are dicts)
+FONT_STARTED = "started"
+FONT_FINISHED = "finished"
+# seconds without any message after which the workers are checked
+LIVENESS_INTERVAL = 1.0
+
+
+def makeFinding(fontPath, check, severity, message, glyphName=None,
+                anchorName=None, **extra):
+    finding = {
+        "font": fontPath,
+        "check": check,
+        "severity": severity,
+        "glyph": glyphName,
+        "anchor": anchorName,
+        "message": message,
+    }
+    finding.update(extra)
+    return finding
+
+
+def iterGlyphFindings(font, fontPath):
+    """
+    Checks that only need one glyph at a time.
+    """
+    for glyphName in font.glyphOrder:
+        if glyphName not in font:
+            continue
+        glyph = font[glyphName]
+        anchorNamesList = [anchor.name for anchor in glyph.anchors
+                           if anchor.name]
+        unnamedCount = len(glyph.anchors) - len(anchorNamesList)
+        if unnamedCount:
+            yield makeFinding(
+                fontPath, UNNAMED_ANCHOR, WARNING,
+                "Glyph %s has %d anchor(s) without a name, which are "
+                "ignored." % (glyphName, unnamedCount),
+                glyphName, count=unnamedCount)
+        for anchorName in sorted(set(anchorNamesList)):
+            if anchorNamesList.count(anchorName) > 1:
+                yield makeFinding(
+                    fontPath, DUPLICATE_ANCHOR, ERROR,
+                    "Glyph %s has %d anchors named %s." % (
+                        glyphName, anchorNamesList.count(anchorName),
+                        anchorName),
+                    glyphName, anchorName)
+        for component in glyph.components:
+            if component.baseGlyph not in font:
+                yield makeFinding(
+                    fontPath, MISSING_COMPONENT, ERROR,
+                    "%s is referencing a glyph named %s, which does not "
+                    "exist in the font." % (glyphName, component.baseGlyph),
+                    glyphName, baseGlyph=component.baseGlyph)
+
+
+def iterClassFindings(index, fontPath):
+    """
+    Checks of the anchor classes, from the index.
+    """
+    for glyphName in index.markGlyphsWithMoreThanOneAnchorTypeList:
+        yield makeFinding(
+            fontPath, MULTIPLE_MARK_ANCHORS, ERROR,
+            "Glyph %s has more than one type of anchor." % glyphName,
+            glyphName)
+
+    contextualClassesList = [
+        splitContextualName(anchorName)[0]
+        for anchorName in index.CXTanchorsOnBasesDict]
+    for anchorName in sorted(index.anchorsOnMarksDict):
+        if (anchorName not in index.anchorsOnBasesDict and
+                anchorName not in contextualClassesList):
+            yield makeFinding(
+                fontPath, ORPHAN_MARK_CLASS, WARNING,
+                "No glyph has a %s anchor for the marks with _%s." % (
+                    anchorName, anchorName),
+                anchorName=anchorName,
+                glyphs=index.anchorsOnMarksDict[anchorName])
+
+    for anchorName in sorted(index.anchorsOnBasesDict):
+        if anchorName not in index.anchorsOnMarksDict:
+            yield makeFinding(
+                fontPath, BASE_WITHOUT_MARKS, WARNING,
+                "No mark glyph has a _%s anchor." % anchorName,
+                anchorName=anchorName,
+                glyphs=index.anchorsOnBasesDict[anchorName])
+
+    for anchorName in sorted(index.CXTanchorsOnBasesDict):
+        anchorNameNOTCXTportion = splitContextualName(anchorName)[0]
+        if anchorNameNOTCXTportion not in index.anchorsOnMarksDict:
+            yield makeFinding(
+                fontPath, CONTEXTUAL_WITHOUT_CLASS, ERROR,
+                "Contextual anchor %s has no mark glyph with a _%s "
+                "anchor." % (anchorName, anchorNameNOTCXTportion),
+                anchorName=anchorName,
+                glyphs=index.CXTanchorsOnBasesDict[anchorName])
+
+
+def iterOffsetFindings(font, index, fontPath):
+    """
+    Combinations listed by the extension which are previewed with a zero
+    offset because one of the anchors is missing.
+    """
+    for glyphName in font.glyphOrder:
+        if glyphName not in font:
+            continue
+        glyph = font[glyphName]
+        for previewName in index.getPreviewNames(glyph):
+            glyphNameToDraw, anchorNameCXTportion = splitContextualName(
+                previewName)
+            if glyphNameToDraw not in font:
+                continue
+            canvasAnchor, drawAnchor = index.getAttachmentAnchors(
+                glyph, font[glyphNameToDraw], anchorNameCXTportion)
+            if canvasAnchor is None or drawAnchor is None:
+                yield makeFinding(
+                    fontPath, MISSING_ANCHOR_OFFSET, ERROR,
+                    "%s + %s is previewed with a zero offset, because %s "
+                    "has no matching anchor." % (
+                        glyphName, previewName,
+                        glyphName if canvasAnchor is None
+                        else glyphNameToDraw),
+                    glyphName, combinedWith=previewName)
+
+
+def iterFontFindings(font, fontPath=None):
+    """
+    Yields the findings of a (defcon) font as they're found.
+    """
+    if fontPath is None:
+        fontPath = font.path
+    for finding in iterGlyphFindings(font, fontPath):
+        yield finding
+    index = AnchorIndex(font)
+    for finding in iterClassFindings(index, fontPath):
+        yield finding
+    for finding in iterOffsetFindings(font, index, fontPath):
+        yield finding
+
+
+def scanFontToQueue(fontPath, queue, taskIndex):
+    """
+    Puts the findings of the UFO in the queue, between a
+    (FONT_STARTED, taskIndex, process id) and a (FONT_FINISHED, taskIndex)
+    message.
+    """
+    queue.put((FONT_STARTED, taskIndex, os.getpid()))
+    try:
+        for finding in iterFontFindings(Font(fontPath), fontPath):
+            queue.put(finding)
+    except Exception as error:
+        queue.put(makeFinding(fontPath, FONT_ERROR, ERROR, repr(error)))
+    finally:
+        queue.put((FONT_FINISHED, taskIndex))
+
+
+def iterFindings(fontPathsList, processes=None):
+    """
+    Yields the findings of the UFOs as soon as they're found,
+    scanning the fonts in parallel. A font whose task failed, or whose
+    process died, gets a FONT_ERROR finding.
+    """
+    # key: task index -- value: font path
+    pendingDict = dict(enumerate(fontPathsList))
+    # key: task index -- value: id of the process scanning the font
+    workersDict = {}
+    # key: task index -- value: error of the task (set by the pool's
+    # result handler thread)
+    failuresDict = {}
+    manager = multiprocessing.Manager()
+    pool = None
+    try:
+        queue = manager.Queue()
+        pool = multiprocessing.Pool(processes)
+        for taskIndex, fontPath in enumerate(fontPathsList):
+            pool.apply_async(
+                scanFontToQueue, (fontPath, queue, taskIndex),
+                error_callback=partial(
+                    failuresDict.__setitem__, taskIndex))
+        pool.close()
+        while pendingDict:
+            try:
+                message = queue.get(timeout=LIVENESS_INTERVAL)
+            except Empty:
+                # all the messages sent so far were read, so the fonts
+                # still pending won't send any more if their task failed
+                # or their process died
+                livePIDsSet = set(
+                    process.pid
+                    for process in multiprocessing.active_children())
+                for taskIndex in sorted(pendingDict):
+                    if taskIndex in failuresDict:
+                        error = repr(failuresDict[taskIndex])
+                    elif (taskIndex in workersDict and
+                            workersDict[taskIndex] not in livePIDsSet):
+                        error = "The process scanning the font died."
+                    else:
+                        continue
+                    yield makeFinding(pendingDict.pop(taskIndex),
+                                      FONT_ERROR, ERROR, error)
+                continue
+            if isinstance(message, dict):
+                yield message
+            elif message[0] == FONT_STARTED:
+                workersDict[message[1]] = message[2]
+            else:
+                pendingDict.pop(message[1], None)
+    finally:
+        # also stops the scans when the consumer stops early
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        manager.shutdown()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Check the anchors of UFOs, writing the findings to "
+                    "stdout as JSON lines.")
+    parser.add_argument("fonts", nargs="+", metavar="UFO")
+    parser.add_argument("-j", "--processes", type=int, default=None,
+                        help="number of fonts scanned in parallel "
+                             "(default: number of CPUs)")
+    options = parser.parse_args(args)
+
+    findingsCount = 0
+    for finding in iterFindings(options.fonts, options.processes):
+        sys.stdout.write(json.dumps(finding, sort_keys=True) + "\n")
+        sys.stdout.flush()
+        findingsCount += 1
+    return 1 if findingsCount else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,270 @@
+# Copyright 2015 Adobe. All rights reserved.
+
+"""
+Suggest positions for one anchor class on every glyph at once.
+
+The outlines are read straight from the contours' points, and cached per glyph
+as lists of cubic segments (a defcon representation, which is destroyed when
+the glyph's contours or components change, or the glyphs its components
+reference). The segments of all the glyphs are loaded in one NumPy array, and
+their extrema and the suggested positions are computed with array operations.
+"""
+
+from itertools import chain
+from math import radians, tan
+
+import numpy as np
+from defcon import Glyph, registerRepresentationFactory
+from fontTools.pens.basePen import BasePen
+
+from anchorBatch import getAnchorClassGlyphNames, getGlyphAnchor
+
+SEGMENTS_REPRESENTATION = "com.adobe.AdjustAnchors.cubicSegments"
+
+# center the anchor horizontally on the bounding box of the outlines
+BOUNDS_CENTER_MODE = "boundsCenter"
+# center the anchor on the deslanted outlines, and slant the center back
+# at the height of the anchor (or at a given height)
+ITALIC_CENTER_MODE = "italicCenter"
+
+SUGGESTION_MODES = [BOUNDS_CENTER_MODE, ITALIC_CENTER_MODE]
+
+
+class CubicSegmentPen(BasePen):
+    """
+    Collects the outlines as a list of cubic segments; lines become cubics
+    with the off-curve points on top of the on-curve points, and
+    the components are decomposed.
+    """
+
+    def __init__(self, glyphSet=None):
+        BasePen.__init__(self, glyphSet)
+        self.segments = []
+        self.startPoint = None
+
+    def _moveTo(self, pt):
+        self.startPoint = pt
+
+    def _lineTo(self, pt):
+        pt0 = self._getCurrentPoint()
+        self.segments.append((pt0, pt0, pt, pt))
+
+    def _curveToOne(self, pt1, pt2, pt3):
+        self.segments.append((self._getCurrentPoint(), pt1, pt2, pt3))
+
+    def _closePath(self):
+        if self._getCurrentPoint() != self.startPoint:
+            self._lineTo(self.startPoint)
+
+
+def readContourSegments(contour, segmentsList):
+    """
+    Appends the cubic segments of the contour to segmentsList, as eight
+    coordinates per segment. Returns False if the contour has segments that
+    aren't lines or cubic curves (the list is then left incomplete).
+    """
+    pointsList = [(point.x, point.y, point.segmentType) for point in contour]
+    onCurveIndicesList = [i for i, (_, _, segmentType)
+                          in enumerate(pointsList) if segmentType is not None]
+    if not onCurveIndicesList:
+        return False
+    pointsCount = len(pointsList)
+    # the first segment of a closed contour comes from its last point
+    previousX, previousY, _ = pointsList[onCurveIndicesList[-1]]
+    previousIndex = onCurveIndicesList[-1] - pointsCount
+    for i in onCurveIndicesList:
+        x, y, segmentType = pointsList[i]
+        if segmentType == "line":
+            segmentsList.extend((previousX, previousY, previousX, previousY,
+                                 x, y, x, y))
+        elif segmentType == "curve" and i - previousIndex == 3:
+            x1, y1, _ = pointsList[i - 2]
+            x2, y2, _ = pointsList[i - 1]
+            segmentsList.extend((previousX, previousY, x1, y1, x2, y2, x, y))
+        elif segmentType != "move":
+            return False
+        previousX, previousY, previousIndex = x, y, i
+    return True
+
+
+def cubicSegmentsFactory(glyph):
+    """
+    Returns the cubic segments of the glyph as a flat list of coordinates,
+    eight per segment: one array for all the glyphs is much faster to build
+    from lists than from one array per glyph.
+    """
+    segmentsList = []
+    for contour in glyph:
+        if not readContourSegments(contour, segmentsList):
+            # quadratic curves are converted by the pen
+            return drawCubicSegments(glyph)
+
+    # the components reuse the segments of their base glyphs
+    layer = glyph.layer
+    for component in glyph.components:
+        if layer is None or component.baseGlyph not in layer:
+            continue
+        baseSegmentsList = layer[component.baseGlyph].getRepresentation(
+            SEGMENTS_REPRESENTATION)
+        xx, xy, yx, yy, dx, dy = component.transformation
+        for x, y in zip(baseSegmentsList[::2], baseSegmentsList[1::2]):
+            segmentsList.append(xx * x + yx * y + dx)
+            segmentsList.append(xy * x + yy * y + dy)
+    return segmentsList
+
+
+def drawCubicSegments(glyph):
+    pen = CubicSegmentPen(glyph.layer)
+    glyph.draw(pen)
+    return [value for segment in pen.segments
+            for point in segment for value in point]
+
+
+def getCubicSegments(glyph):
+    """
+    Returns the cubic segments of the glyph as an array of shape
+    (segments, 4, 2).
+    """
+    return np.array(cubicSegmentsFactory(glyph), dtype=float).reshape(
+        -1, 4, 2)
+
+
+registerRepresentationFactory(
+    Glyph, SEGMENTS_REPRESENTATION, cubicSegmentsFactory,
+    destructiveNotifications=("Glyph.ContoursChanged",
+                              "Glyph.ComponentsChanged"))
+
+
+def cubicExtrema(values):
+    """
+    values is an array of shape (segments, 4), with one coordinate of the
+    segments' points. Returns the minimum and the maximum of each segment.
+    """
+    p0, p1, p2, p3 = values.T
+    # the derivative divided by 3 is a*t**2 + b*t + c
+    a = -p0 + 3 * p1 - 3 * p2 + p3
+    b = 2 * (p0 - 2 * p1 + p2)
+    c = p1 - p0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sqrtDiscriminant = np.sqrt(b * b - 4 * a * c)
+        linear = np.abs(a) < 1e-9
+        t1 = np.where(linear, -c / b, (-b + sqrtDiscriminant) / (2 * a))
+        t2 = np.where(linear, np.nan, (-b - sqrtDiscriminant) / (2 * a))
+
+    candidates = [p0, p3]
+    for t in (t1, t2):
+        # NaN roots are not valid either
+        valid = (t > 0) & (t < 1)
+        t = np.where(valid, t, 0)
+        mt = 1 - t
+        value = (mt ** 3 * p0 + 3 * mt * mt * t * p1 +
+                 3 * mt * t * t * p2 + t ** 3 * p3)
+        candidates.append(np.where(valid, value, p0))
+    candidates = np.stack(candidates)
+    return candidates.min(axis=0), candidates.max(axis=0)
+
+
+class AnchorSuggestionEngine(object):
+
+    def __init__(self, font):
+        # a fontParts font wraps a defcon font
+        if hasattr(font, "naked"):
+            font = font.naked()
+        self.font = font
+
+    def getSegmentArrays(self, glyphNamesList):
+        """
+        Returns the segments of all the glyphs concatenated in one array of
+        shape (segments, 4, 2), and the number of segments of each glyph.
+        """
+        segmentsList = [
+            self.font[glyphName].getRepresentation(SEGMENTS_REPRESENTATION)
+            for glyphName in glyphNamesList]
+        counts = np.array([len(segments) // 8 for segments in segmentsList],
+                          dtype=int)
+        segments = np.fromiter(
+            chain.from_iterable(segmentsList), dtype=float,
+            count=int(counts.sum()) * 8)
+        return segments.reshape(-1, 4, 2), counts
+
+    def getOutlineExtrema(self, glyphNamesList, italicAngle=0):
+        """
+        Returns an array of shape (glyphs, 4) with the xMin, yMin, xMax, yMax
+        of the outlines, after removing the slant of the italic angle.
+        The rows of the glyphs without outlines are NaN.
+        """
+        segments, counts = self.getSegmentArrays(glyphNamesList)
+        extrema = np.full((len(glyphNamesList), 4), np.nan)
+        if not len(segments):
+            return extrema
+
+        xValues = segments[:, :, 0]
+        yValues = segments[:, :, 1]
+        if italicAngle:
+            xValues = xValues + yValues * tan(radians(italicAngle))
+        xMin, xMax = cubicExtrema(xValues)
+        yMin, yMax = cubicExtrema(yValues)
+
+        # the segments of each glyph are contiguous, so the glyphs
+        # with outlines can be reduced by their first segment index
+        hasOutlines = counts > 0
+        starts = (np.cumsum(counts) - counts)[hasOutlines]
+        extrema[hasOutlines, 0] = np.minimum.reduceat(xMin, starts)
+        extrema[hasOutlines, 1] = np.minimum.reduceat(yMin, starts)
+        extrema[hasOutlines, 2] = np.maximum.reduceat(xMax, starts)
+        extrema[hasOutlines, 3] = np.maximum.reduceat(yMax, starts)
+        return extrema
+
+    def suggestAnchorPositions(self, anchorName, mode, glyphNamesList=None,
+                               height=None, italicAngle=None, delta=(0, 0)):
+        """
+        Returns a dictionary in the format of computeAnchorPositions
+        (key: glyph name -- value: tuple containing the current and the
+        suggested position of the anchor). By default all the glyphs that
+        have the anchor are considered, and the font's italic angle is used.
+        """
+        if mode not in SUGGESTION_MODES:
+            raise ValueError("Unknown suggestion mode: %r" % mode)
+        if glyphNamesList is None:
+            glyphNamesList = getAnchorClassGlyphNames(self.font, anchorName)
+        if italicAngle is None:
+            italicAngle = self.font.info.italicAngle or 0
+        if mode == BOUNDS_CENTER_MODE:
+            italicAngle = 0
+
+        anchoredNamesList = []
+        anchorPositionsList = []
+        for glyphName in glyphNamesList:
+            if glyphName not in self.font:
+                continue
+            anchor = getGlyphAnchor(self.font[glyphName], anchorName)
+            if anchor is None:
+                continue
+            anchoredNamesList.append(glyphName)
+            anchorPositionsList.append((anchor.x, anchor.y))
+        if not anchoredNamesList:
+            return {}
+        anchorPositions = np.array(anchorPositionsList, dtype=float)
+
+        extrema = self.getOutlineExtrema(anchoredNamesList, italicAngle)
+        centers = (extrema[:, 0] + extrema[:, 2]) / 2
+        if height is None:
+            newY = anchorPositions[:, 1]
+        else:
+            newY = np.full(len(anchoredNamesList), float(height))
+        # slant the center back at the height of the anchor
+        newX = centers - newY * tan(radians(italicAngle))
+        newX = np.round(newX + delta[0])
+        newY = np.round(newY + delta[1])
+
+        changed = ~np.isnan(newX) & (
+            (newX != anchorPositions[:, 0]) | (newY != anchorPositions[:, 1]))
+        positionsDict = {}
+        # lists of Python numbers are much faster to index than arrays
+        newXList = newX.tolist()
+        newYList = newY.tolist()
+        for index in np.flatnonzero(changed).tolist():
+            positionsDict[anchoredNamesList[index]] = (
+                anchorPositionsList[index],
+                (int(newXList[index]), int(newYList[index])))
+        return positionsDict
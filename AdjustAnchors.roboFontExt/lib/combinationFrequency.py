@@ -0,0 +1,374 @@
+# Copyright 2015 Adobe. All rights reserved.
+
+"""
+Frequency of the base + mark combinations of a font in text corpora.
+
+The corpora (UTF-8 text files, of any size) are memory-mapped and split
+into chunks at line breaks, and the chunks are counted in parallel. Each
+character is mapped to a glyph thru the Unicode values of the UFO's glyphs,
+and every mark glyph (a glyph with a '_' anchor) is counted with the base
+it follows, and with the mark right before it, if it attaches to it (the
+mark's class is the one of the first base anchor of the mark before it, as
+for the stacks of marks previewed by the extension). The counts are
+saved as a compact index, which the extension uses to list the most
+frequent combinations first:
+
+    python combinationFrequency.py Regular.ufo corpus/*.txt -o Regular.npz
+"""
+
+import argparse
+import json
+import mmap
+import multiprocessing
+import os
+import sys
+import unicodedata
+
+import numpy as np
+
+from anchorIndex import AnchorIndex, getNamedAnchors, splitContextualName
+from glyphRecords import readGlyphRecords
+
+# size of the chunks the corpora are split into, in bytes
+CHUNK_SIZE = 8 * 1024 * 1024
+# number of characters of a chunk counted at once, which bounds the memory
+# used by the counting arrays (about 30 bytes per character)
+BLOCK_SIZE = 1024 * 1024
+# number of Unicode code points
+UNICODE_RANGE = 0x110000
+
+# the state of the counting processes, set by initCounting
+_charTable = None
+_markClasses = None
+_stackClasses = None
+_decompose = True
+
+
+class CombinationFrequencies(object):
+    """
+    Number of occurrences of the (base or mark, mark) glyph pairs.
+    """
+
+    def __init__(self, countsDict=None):
+        # key: (base glyph name, mark glyph name) -- value: count
+        self.countsDict = dict(countsDict or {})
+
+    def __len__(self):
+        return len(self.countsDict)
+
+    def getCount(self, baseName, markName):
+        return self.countsDict.get((baseName, markName), 0)
+
+    def getPreviewCount(self, glyphName, previewName, marksDict):
+        """
+        Returns the count of a combination listed by the extension
+        for the glyph (see AnchorIndex.getPreviewNames).
+        """
+        # the contextual portion doesn't change which glyphs are combined
+        previewName = splitContextualName(previewName)[0]
+        if previewName in marksDict:
+            return self.getCount(glyphName, previewName)
+        return self.getCount(previewName, glyphName)
+
+    def sortPreviewNames(self, glyphName, previewNamesList, marksDict,
+                         glyphOrder):
+        """
+        Returns the names sorted by decreasing frequency of their
+        combination with the glyph, then in the font's glyph order.
+        """
+        orderDict = dict((name, i) for i, name in enumerate(glyphOrder))
+        return sorted(previewNamesList, key=lambda name: (
+            -self.getPreviewCount(glyphName, name, marksDict),
+            orderDict.get(name, len(orderDict))))
+
+    def sortCombinations(self, combinationsList):
+        """
+        Sorts the (base name, mark name) pairs by decreasing frequency,
+        keeping the order of the pairs which have the same count.
+        """
+        return sorted(combinationsList,
+                      key=lambda pair: -self.getCount(*pair))
+
+    def save(self, path):
+        glyphNamesList = sorted(
+            set(name for pair in self.countsDict for name in pair))
+        glyphIDsDict = dict(
+            (name, i) for i, name in enumerate(glyphNamesList))
+        pairsList = sorted(self.countsDict)
+        with open(path, "wb") as indexFile:
+            np.savez_compressed(
+                indexFile,
+                glyphNames=np.array(glyphNamesList, dtype=str),
+                pairs=np.array(
+                    [(glyphIDsDict[baseName], glyphIDsDict[markName])
+                     for baseName, markName in pairsList],
+                    dtype=np.int32).reshape(-1, 2),
+                counts=np.array(
+                    [self.countsDict[pair] for pair in pairsList],
+                    dtype=np.int64))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            glyphNamesList = data["glyphNames"].tolist()
+            pairs = data["pairs"].tolist()
+            counts = data["counts"].tolist()
+        return cls(
+            ((glyphNamesList[baseID], glyphNamesList[markID]), count)
+            for (baseID, markID), count in zip(pairs, counts))
+
+
+def makeCharacterTables(records):
+    """
+    Returns the list of the glyph names of the font (the glyph IDs used
+    when counting), the cmap as a dict (key: code point -- value: glyph ID),
+    and a dict of the class indices of the marks (key: glyph ID -- value:
+    index of the mark's class) and one of the classes the marks stack
+    (key: glyph ID -- value: index of the class of the mark's first base
+    anchor).
+    """
+    index = AnchorIndex(records)
+    classIndexDict = dict(
+        (anchorName, i)
+        for i, anchorName in enumerate(sorted(index.anchorsOnMarksDict)))
+    glyphNamesList = list(records.glyphOrder)
+    cmapDict = {}
+    markClassesDict = {}
+    stackClassesDict = {}
+    for glyphID, glyphName in enumerate(glyphNamesList):
+        for codePoint in records[glyphName].unicodes:
+            # the first glyph in the glyph order wins
+            cmapDict.setdefault(codePoint, glyphID)
+        if glyphName not in index.marksDict:
+            continue
+        markClassesDict[glyphID] = classIndexDict[index.marksDict[glyphName]]
+        # the marks only stack on the first base anchor of the mark
+        # (see MarkStackAssembler.getStackingMarkNames)
+        for anchor in getNamedAnchors(records[glyphName]):
+            if anchor.name[0] != '_':
+                if anchor.name in classIndexDict:
+                    stackClassesDict[glyphID] = classIndexDict[anchor.name]
+                break
+    return glyphNamesList, cmapDict, markClassesDict, stackClassesDict
+
+
+def initCounting(cmapDict, markClassesDict, stackClassesDict, glyphCount,
+                 decompose=True):
+    """
+    Builds the lookup tables of a counting process.
+    """
+    global _charTable, _markClasses, _stackClasses, _decompose
+    _charTable = np.full(UNICODE_RANGE, -1, dtype=np.int32)
+    if cmapDict:
+        codePoints = np.fromiter(cmapDict.keys(), dtype=np.int64)
+        _charTable[codePoints] = np.fromiter(
+            cmapDict.values(), dtype=np.int32)
+    _markClasses, _stackClasses = makeClassArrays(
+        markClassesDict, stackClassesDict, glyphCount)
+    _decompose = decompose
+
+
+def makeClassArrays(markClassesDict, stackClassesDict, glyphCount):
+    """
+    Returns the arrays of the mark classes (-1 for the glyphs that aren't
+    marks) and of the stacking classes (-2 for the glyphs nothing stacks
+    on) of the glyphs, by glyph ID. The last item is for the characters
+    that aren't in the cmap (glyph ID -1).
+    """
+    markClasses = np.full(glyphCount + 1, -1, dtype=np.int32)
+    stackClasses = np.full(glyphCount + 1, -2, dtype=np.int32)
+    for classes, classesDict in ((markClasses, markClassesDict),
+                                 (stackClasses, stackClassesDict)):
+        if classesDict:
+            classes[np.fromiter(classesDict.keys(), dtype=np.int64)] = (
+                np.fromiter(classesDict.values(), dtype=np.int32))
+    return markClasses, stackClasses
+
+
+def countBlock(glyphIDs, contextLength, markClasses, stackClasses):
+    """
+    Counts the combinations in an array of glyph IDs (-1 for the
+    characters that aren't in the cmap), whose first contextLength items
+    are only there to be attached to. Returns the pairs as an array of
+    keys (first glyph ID * (glyph count + 1) + mark glyph ID), and the
+    array of their counts.
+    """
+    isMark = markClasses[glyphIDs] >= 0
+    positions = np.arange(len(glyphIDs), dtype=np.int32)
+    # the position of the last glyph that isn't a mark, at each position
+    lastBase = np.maximum.accumulate(
+        np.where(isMark, np.int32(-1), positions))
+
+    markPositions = np.nonzero(isMark[contextLength:])[0].astype(np.int32)
+    markPositions += contextLength
+    basePositions = lastBase[markPositions]
+    # skip the marks at the start of the text
+    attached = basePositions >= 0
+    bases = glyphIDs[basePositions[attached]]
+    marks = glyphIDs[markPositions[attached]]
+    # skip the marks that follow a character that isn't in the cmap
+    attached = bases >= 0
+    bases, marks = bases[attached], marks[attached]
+
+    # mark + mark, when the mark attaches to the previous one
+    stacked = markPositions[markPositions > 0]
+    stacked = stacked[stackClasses[glyphIDs[stacked - 1]] ==
+                      markClasses[glyphIDs[stacked]]]
+
+    # one number per pair, which is much faster to count than rows
+    glyphCount = len(markClasses)
+    keys = (np.concatenate([bases, glyphIDs[stacked - 1]]).astype(np.int64) *
+            glyphCount + np.concatenate([marks, glyphIDs[stacked]]))
+    return np.unique(keys, return_counts=True)
+
+
+def getBlockContext(glyphIDs, markClasses):
+    """
+    Returns the glyph IDs the start of the next block can attach to: the
+    last glyph that isn't a mark, and the last glyph if it's a mark.
+    """
+    isMark = markClasses[glyphIDs] >= 0
+    nonMarkPositions = np.nonzero(~isMark)[0]
+    contextList = []
+    if len(nonMarkPositions):
+        contextList.append(glyphIDs[nonMarkPositions[-1]])
+    if len(glyphIDs) and isMark[-1]:
+        contextList.append(glyphIDs[-1])
+    return np.array(contextList, dtype=np.int32)
+
+
+def countSequences(text, charTable, markClasses, stackClasses,
+                   blockSize=BLOCK_SIZE):
+    """
+    Counts the combinations in the text, one block of characters at a
+    time. Returns the pairs of glyph IDs, as an array of shape (pairs, 2),
+    and the array of their counts.
+    """
+    keysList, countsList = [], []
+    context = np.zeros(0, dtype=np.int32)
+    for start in range(0, len(text), blockSize):
+        codePoints = np.frombuffer(
+            text[start:start + blockSize].encode("utf-32-le", "replace"),
+            dtype=np.uint32)
+        glyphIDs = np.concatenate([context, charTable[codePoints]])
+        del codePoints
+        keys, counts = countBlock(
+            glyphIDs, len(context), markClasses, stackClasses)
+        keysList.append(keys)
+        countsList.append(counts)
+        # the combinations across the end of the block
+        context = getBlockContext(glyphIDs, markClasses)
+
+    glyphCount = len(markClasses)
+    if not keysList:
+        return np.zeros((0, 2), dtype=np.int64), np.zeros(0, dtype=np.int64)
+    keys, inverse = np.unique(np.concatenate(keysList), return_inverse=True)
+    counts = np.zeros(len(keys), dtype=np.int64)
+    np.add.at(counts, inverse, np.concatenate(countsList))
+    return np.stack(np.divmod(keys, glyphCount), axis=1), counts
+
+
+def countChunk(chunk):
+    path, start, end = chunk
+    with open(path, "rb") as corpusFile:
+        corpus = mmap.mmap(corpusFile.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            text = corpus[start:end].decode("utf-8", "replace")
+        finally:
+            corpus.close()
+    if _decompose:
+        # precomposed characters are counted as base + mark(s)
+        text = unicodedata.normalize("NFD", text)
+    return countSequences(text, _charTable, _markClasses, _stackClasses)
+
+
+def iterChunks(path, chunkSize=CHUNK_SIZE):
+    """
+    Yields the (path, start, end) byte ranges of the file, split
+    at line breaks so that no combination is split.
+    """
+    size = os.path.getsize(path)
+    if not size:
+        return
+    with open(path, "rb") as corpusFile:
+        corpus = mmap.mmap(corpusFile.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            start = 0
+            while start < size:
+                end = corpus.find(b"\n", start + chunkSize)
+                end = size if end < 0 else end + 1
+                yield path, start, end
+                start = end
+        finally:
+            corpus.close()
+
+
+def countCorpora(ufoPath, corpusPathsList, processes=None,
+                 chunkSize=CHUNK_SIZE, decompose=True):
+    """
+    Returns the CombinationFrequencies of the UFO's combinations
+    in the corpora, counted in parallel.
+    """
+    records = readGlyphRecords(ufoPath)
+    glyphNamesList, cmapDict, markClassesDict, stackClassesDict = (
+        makeCharacterTables(records))
+    chunksList = [chunk for path in corpusPathsList
+                  for chunk in iterChunks(path, chunkSize)]
+
+    countsDict = {}
+    pool = multiprocessing.Pool(
+        processes, initCounting,
+        (cmapDict, markClassesDict, stackClassesDict, len(glyphNamesList),
+         decompose))
+    try:
+        for pairs, counts in pool.imap_unordered(countChunk, chunksList):
+            for (baseID, markID), count in zip(pairs.tolist(),
+                                               counts.tolist()):
+                pair = (glyphNamesList[baseID], glyphNamesList[markID])
+                countsDict[pair] = countsDict.get(pair, 0) + count
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return CombinationFrequencies(countsDict)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Count the base + mark combinations of a UFO in text "
+                    "corpora, writing them to stdout as JSON lines, the most "
+                    "frequent first.")
+    parser.add_argument("ufo", metavar="UFO")
+    parser.add_argument("corpora", nargs="+", metavar="TEXT_FILE",
+                        help="UTF-8 text files")
+    parser.add_argument("-o", "--output", metavar="NPZ",
+                        help="save the index used by the extension")
+    parser.add_argument("-j", "--processes", type=int, default=None,
+                        help="number of chunks counted in parallel "
+                             "(default: number of CPUs)")
+    parser.add_argument("--chunk-size", type=int, default=8,
+                        help="size of the chunks, in MB (default: 8)")
+    parser.add_argument("--no-decompose", dest="decompose",
+                        action="store_false",
+                        help="don't count the precomposed characters "
+                             "as base + mark(s)")
+    options = parser.parse_args(args)
+
+    frequencies = countCorpora(
+        options.ufo, options.corpora, options.processes,
+        options.chunk_size * 1024 * 1024, options.decompose)
+    if options.output:
+        frequencies.save(options.output)
+    for (baseName, markName), count in sorted(
+            frequencies.countsDict.items(),
+            key=lambda item: (-item[1], item[0])):
+        sys.stdout.write(json.dumps(
+            {"base": baseName, "mark": markName, "count": count},
+            sort_keys=True) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+# Copyright 2015 Adobe. All rights reserved.
+
+"""
+Lightweight records of the glyphs of a UFO, read straight from the .glif
+files: the anchors, the advance width and the Unicode values, without the
+outlines. They can be used instead of a font by the AnchorIndex, and the
+content hash of each .glif file is kept, so that the glyphs that didn't
+change since a previous reading are not parsed again.
+"""
+
+from collections import namedtuple
+import hashlib
+import os
+
+from fontTools.ufoLib import DEFAULT_GLYPHS_DIRNAME, UFOReader
+from fontTools.ufoLib.glifLib import readGlyphFromString
+
+Anchor = namedtuple("Anchor", ["name", "x", "y"])
+
+
+class GlyphRecord(object):
+    """
+    The parts of a glyph needed by the AnchorIndex (no outlines),
+    and its Unicode values.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.width = 0
+        self.unicodes = []
+        self.anchors = []
+
+
+class GlyphRecords(dict):
+    """
+    key: glyph name -- value: GlyphRecord; has the glyphOrder and the
+    content hashes of the .glif files.
+    """
+
+    def __init__(self):
+        dict.__init__(self)
+        self.glyphOrder = []
+        # key: glyph name -- value: hash of the .glif file
+        self.hashesDict = {}
+
+
+def readGlyphRecord(glyphName, glifData):
+    glyph = GlyphRecord(glyphName)
+    readGlyphFromString(glifData, glyph, validate=False)
+    glyph.anchors = [
+        Anchor(anchor.get("name", ""), anchor["x"], anchor["y"])
+        for anchor in glyph.anchors
+        if anchor.get("name")]
+    return glyph
+
+
+def readGlyphRecords(ufoPath, previousRecords=None):
+    """
+    Reads the anchors of the UFO's default layer. The glyphs whose .glif
+    file has the same content hash as in previousRecords are not parsed,
+    their records are reused.
+    """
+    reader = UFOReader(ufoPath, validate=False)
+    glyphSet = reader.getGlyphSet(validateRead=False)
+    # the .glif files of unzipped UFOs are read directly, which is much
+    # faster than going thru the glyph set's file system
+    glyphsDir = os.path.join(ufoPath, DEFAULT_GLYPHS_DIRNAME)
+    readDirectly = os.path.isdir(glyphsDir)
+    records = GlyphRecords()
+    for glyphName, fileName in glyphSet.contents.items():
+        if readDirectly:
+            with open(os.path.join(glyphsDir, fileName), "rb") as glifFile:
+                glifData = glifFile.read()
+        else:
+            glifData = glyphSet.getGLIF(glyphName)
+        glifHash = hashlib.sha1(glifData).hexdigest()
+        records.hashesDict[glyphName] = glifHash
+        if (previousRecords is not None and
+                previousRecords.hashesDict.get(glyphName) == glifHash):
+            records[glyphName] = previousRecords[glyphName]
+        else:
+            records[glyphName] = readGlyphRecord(glyphName, glifData)
+    glyphOrder = reader.readLib().get("public.glyphOrder", [])
+    records.glyphOrder = [
+        glyphName for glyphName in glyphOrder if glyphName in records]
+    records.glyphOrder.extend(sorted(
+        set(records) - set(records.glyphOrder)))
+    return records
@@ -0,0 +1,131 @@
+# Copyright 2015 Adobe. All rights reserved.
+
+"""
+Stacks of marks: a base followed by a chain of marks, each mark being
+attached to the previous one (mark-to-mark), as in Vietnamese or Arabic.
+
+The stacks are enumerated lazily, so that only the ones which are
+previewed are assembled, and the parts of each chain are memoized, so
+that base + mark1 is reused when assembling base + mark1 + mark2.
+"""
+
+import itertools
+
+from anchorIndex import CONTEXTUAL_ANCHOR_TAG, getNamedAnchors
+
+# number of marks stacked on the base, by default
+DEFAULT_STACK_DEPTH = 2
+
+
+class MarkStackAssembler(object):
+    """
+    font can be any mapping of glyph names to (fontParts, robofab or
+    defcon) glyphs, and index is the AnchorIndex of its anchors.
+    """
+
+    def __init__(self, font, index):
+        self.font = font
+        self.index = index
+        # key: chain of glyph names -- value: list of (glyph name, offset)
+        # NOTE: Only the chains that were extended are kept
+        self.partsDict = {}
+
+    def clear(self):
+        self.partsDict.clear()
+
+    def getFirstMarkNames(self, baseName):
+        """
+        Returns the names of the marks that attach to the base glyph.
+        """
+        if baseName in self.index.marksDict:
+            return self.getStackingMarkNames(baseName)
+        markNamesList = []
+        for anchor in getNamedAnchors(self.font[baseName]):
+            # contextual anchors only attach one mark
+            if (anchor.name[0] == '_' or
+                    CONTEXTUAL_ANCHOR_TAG in anchor.name):
+                continue
+            markNamesList.extend(
+                self.index.anchorsOnMarksDict.get(anchor.name, []))
+        return markNamesList
+
+    def getStackingMarkNames(self, markName):
+        """
+        Returns the names of the marks that attach to the mark glyph,
+        i.e. the marks that have the anchor matching its first base
+        anchor (the one used by AnchorIndex.getAnchorOffsets).
+        """
+        for anchor in getNamedAnchors(self.font[markName]):
+            if anchor.name[0] != '_':
+                return self.index.anchorsOnMarksDict.get(anchor.name, [])
+        return []
+
+    def iterChainExtensions(self, chain, depth):
+        """
+        Yields the chains which extend the chain with up to depth marks,
+        depth first: each chain is followed by the chains which extend it.
+        """
+        if depth < 1:
+            return
+        # one iterator of the candidate marks per level of the chain
+        iteratorsList = [iter(self.getStackingMarkNames(chain[-1]))]
+        while iteratorsList:
+            markName = next(iteratorsList[-1], None)
+            if markName is None:
+                iteratorsList.pop()
+                chain = chain[:-1]
+                continue
+            newChain = chain + (markName,)
+            yield newChain
+            if len(iteratorsList) < depth:
+                chain = newChain
+                iteratorsList.append(
+                    iter(self.getStackingMarkNames(markName)))
+
+    def iterMarkStacks(self, baseName, depth=DEFAULT_STACK_DEPTH):
+        """
+        Yields the chains of glyph names (base, mark1, ..., markN), with
+        1 <= N <= depth. The first marks take turns: the chains of each
+        mark1 are enumerated depth first, and interleaved round-robin, so
+        that any number of chains shows every mark1 before a second chain
+        of the same mark1.
+        """
+        iteratorsList = []
+        for markName in self.getFirstMarkNames(baseName):
+            chain = (baseName, markName)
+            extensions = self.iterChainExtensions(chain, depth - 1)
+            iteratorsList.append(itertools.chain([chain], extensions))
+        while iteratorsList:
+            activeIteratorsList = []
+            for iterator in iteratorsList:
+                chain = next(iterator, None)
+                if chain is not None:
+                    yield chain
+                    activeIteratorsList.append(iterator)
+            iteratorsList = activeIteratorsList
+
+    def getStackParts(self, chain):
+        """
+        Returns the list of (glyph name, (x, y) offset) tuples of the
+        chain, as used by previewGlyphs.newPreviewGlyph.
+        """
+        chain = tuple(chain)
+        if len(chain) == 1:
+            return [(chain[0], (0, 0))]
+        prefix = chain[:-1]
+        prefixParts = self.partsDict.get(prefix)
+        if prefixParts is None:
+            prefixParts = self.partsDict[prefix] = self.getStackParts(prefix)
+        # the last mark is attached to the previous glyph
+        previousName, (previousX, previousY) = prefixParts[-1]
+        offsetX, offsetY = self.index.getAnchorOffsets(
+            self.font[previousName], self.font[chain[-1]])
+        return prefixParts + [
+            (chain[-1], (previousX + offsetX, previousY + offsetY))]
+
+    def iterStackParts(self, baseName, depth=DEFAULT_STACK_DEPTH):
+        """
+        Yields the (chain, parts) tuples of the stacks on the base glyph.
+        """
+        for chain in self.iterMarkStacks(baseName, depth):
+            yield chain, self.getStackParts(chain)
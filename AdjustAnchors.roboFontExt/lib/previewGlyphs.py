@@ -0,0 +1,54 @@
+# Copyright 2015 Adobe. All rights reserved.
+
+"""
+Glyphs for the preview that reference the outlines of the font instead of
+copying them.
+
+A preview glyph is an instance of the layer's glyph class (RoboFont's own
+subclass, inside the app) that knows the layer but doesn't belong to it.
+It only holds components pointing at the glyphs of the combination, so the
+outlines (and their cached representations) are shared by every
+combination, and the memory used by a preview row depends on the number of
+combinations, not on the number of points. The components are
+resolved thru the layer, so the glyphs can be rasterized by rasterTiles,
+or drawn by any pen that is given the layer as its glyphSet.
+"""
+
+
+def newPreviewGlyph(layer, partsList, width=0):
+    """
+    partsList is a list of (glyph name, (x, y) offset) tuples.
+    The sidebearings can be adjusted afterwards thru leftMargin and
+    rightMargin, which shift the components.
+    """
+    # not added to the layer
+    glyph = layer.instantiateGlyphObject()
+    pointPen = glyph.getPointPen()
+    for glyphName, (offsetX, offsetY) in partsList:
+        pointPen.addComponent(glyphName, (1, 0, 0, 1, offsetX, offsetY))
+    glyph.width = width
+    return glyph
+
+
+def getMissingComponentName(layer, glyphName, missingNamesDict=None):
+    """
+    Returns the name of the first glyph referenced by the components of
+    glyphName (at any depth) which is not in the layer, or None.
+    missingNamesDict caches the results between calls.
+    """
+    if missingNamesDict is None:
+        missingNamesDict = {}
+    if glyphName in missingNamesDict:
+        return missingNamesDict[glyphName]
+    # also prevents infinite recursion in case of circular references
+    missingNamesDict[glyphName] = None
+    for component in layer[glyphName].components:
+        if component.baseGlyph not in layer:
+            missingName = component.baseGlyph
+        else:
+            missingName = getMissingComponentName(
+                layer, component.baseGlyph, missingNamesDict)
+        if missingName is not None:
+            missingNamesDict[glyphName] = missingName
+            break
+    return missingNamesDict[glyphName]
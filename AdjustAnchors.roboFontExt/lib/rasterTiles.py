@@ -0,0 +1,311 @@
+# Copyright 2015 Adobe. All rights reserved.
+
+"""
+Offscreen raster tiles of the base + mark combinations.
+
+The tiles are rasterized with NumPy (no AppKit is needed, so they can be
+made headless), and kept in a TileCache, keyed by the combination, the
+revision of its outlines, the point size and the fill style. A combination
+is rasterized again only when its outlines, its offsets or its advance
+width change.
+"""
+
+from collections import OrderedDict, namedtuple
+from itertools import count
+import struct
+import zlib
+
+import numpy as np
+from defcon import Glyph, registerRepresentationFactory
+
+from anchorSuggestions import getCubicSegments
+
+OUTLINE_REVISION_REPRESENTATION = "com.adobe.AdjustAnchors.outlineRevision"
+
+# number of samples per pixel, in each direction
+SUPERSAMPLING = 4
+# number of lines each curve is flattened into
+CURVE_STEPS = 12
+
+# alpha is the pixels' coverage (array of shape (height, width), with
+# values 0-255); the glyph's origin is at column originX, and row originY
+Tile = namedtuple("Tile", ["alpha", "originX", "originY", "advance",
+                           "fillStyle"])
+
+_revisionCounter = count()
+
+
+def outlineRevisionFactory(glyph):
+    # a new number every time the representation is destroyed
+    return next(_revisionCounter)
+
+
+registerRepresentationFactory(
+    Glyph, OUTLINE_REVISION_REPRESENTATION, outlineRevisionFactory,
+    destructiveNotifications=("Glyph.ContoursChanged",
+                              "Glyph.ComponentsChanged"))
+
+
+def getOutlineRevision(layer, glyphName):
+    """
+    Returns a tuple that changes whenever the outlines of the glyph,
+    or of the glyphs referenced by its components, change (defcon destroys
+    the representations of a composite when its base glyphs change).
+    """
+    return (glyphName, layer[glyphName].getRepresentation(
+        OUTLINE_REVISION_REPRESENTATION))
+
+
+def getTileKey(previewGlyph, pointSize, fillStyle):
+    """
+    previewGlyph is a (defcon) glyph made of components only, as made by
+    previewGlyphs.newPreviewGlyph. The key follows its components as they
+    are, so it changes when they're shifted by leftMargin or rightMargin.
+    """
+    layer = previewGlyph.layer
+    parts = tuple((component.baseGlyph, tuple(component.transformation))
+                  for component in previewGlyph.components)
+    revision = tuple(getOutlineRevision(layer, glyphName)
+                     for glyphName, transformation in parts
+                     if glyphName in layer)
+    return (parts, previewGlyph.width, revision, pointSize, tuple(fillStyle))
+
+
+def flattenSegments(segments):
+    """
+    Converts an array of cubic segments of shape (segments, 4, 2) into an
+    array of lines of shape (lines, 2, 2).
+    """
+    if not len(segments):
+        return np.zeros((0, 2, 2))
+    p0, p1, p2, p3 = (segments[:, i] for i in range(4))
+    isLine = np.all(p0 == p1, axis=1) & np.all(p2 == p3, axis=1)
+    lines = [np.stack([p0[isLine], p3[isLine]], axis=1)]
+
+    curves = segments[~isLine]
+    if len(curves):
+        t = np.linspace(0, 1, CURVE_STEPS + 1)[:, None]
+        mt = 1 - t
+        # shape (curves, steps + 1, 2)
+        points = (mt ** 3 * curves[:, None, 0] +
+                  3 * mt * mt * t * curves[:, None, 1] +
+                  3 * mt * t * t * curves[:, None, 2] +
+                  t ** 3 * curves[:, None, 3])
+        lines.append(np.stack(
+            [points[:, :-1], points[:, 1:]], axis=2).reshape(-1, 2, 2))
+    return np.concatenate(lines)
+
+
+def rasterizeLines(lines, width, height):
+    """
+    Fills the closed outlines made of lines (in pixel units, y pointing
+    down) with the nonzero winding rule. Returns the coverage of each pixel,
+    as an array of shape (height, width) with values 0-255.
+    """
+    sampledWidth = width * SUPERSAMPLING
+    sampledHeight = height * SUPERSAMPLING
+    lines = lines * SUPERSAMPLING
+    x0, y0 = lines[:, 0, 0], lines[:, 0, 1]
+    x1, y1 = lines[:, 1, 0], lines[:, 1, 1]
+    direction = np.where(y1 > y0, 1, -1)
+
+    # the sample rows crossed by each line (samples are at the row centers)
+    rowStart = np.clip(np.ceil(np.minimum(y0, y1) - 0.5), 0, sampledHeight)
+    rowEnd = np.clip(np.ceil(np.maximum(y0, y1) - 0.5), 0, sampledHeight)
+    crossingsCount = (rowEnd - rowStart).astype(int)
+    lineIndex = np.repeat(np.arange(len(lines)), crossingsCount)
+    rows = (np.repeat(rowStart.astype(int), crossingsCount) +
+            np.arange(crossingsCount.sum()) -
+            np.repeat(np.cumsum(crossingsCount) - crossingsCount,
+                      crossingsCount))
+
+    # x of the crossings, and the first sample column on their right
+    sampleY = rows + 0.5
+    t = (sampleY - y0[lineIndex]) / (y1[lineIndex] - y0[lineIndex])
+    crossingX = x0[lineIndex] + t * (x1[lineIndex] - x0[lineIndex])
+    columns = np.clip(np.ceil(crossingX - 0.5), 0, sampledWidth).astype(int)
+
+    winding = np.zeros((sampledHeight, sampledWidth + 1), dtype=np.int32)
+    np.add.at(winding, (rows, columns), direction[lineIndex])
+    filled = np.cumsum(winding[:, :-1], axis=1) != 0
+
+    coverage = filled.reshape(
+        height, SUPERSAMPLING, width, SUPERSAMPLING).mean(axis=(1, 3))
+    return np.round(coverage * 255).astype(np.uint8)
+
+
+def rasterizeGlyph(glyph, pointSize, unitsPerEm, fillStyle=(0, 0, 0, 1)):
+    """
+    Returns a Tile of the defcon glyph (its components are resolved thru
+    the glyph's layer) at the given point size, one point being one pixel.
+    """
+    scale = float(pointSize) / unitsPerEm
+    advance = glyph.width * scale
+    # not cached as a representation, the tile is the cache
+    segments = getCubicSegments(glyph)
+    if not len(segments):
+        return Tile(np.zeros((0, 0), dtype=np.uint8), 0, 0, advance,
+                    tuple(fillStyle))
+
+    lines = flattenSegments(segments) * scale
+    # one pixel of padding around the outlines
+    xMin = int(np.floor(lines[:, :, 0].min())) - 1
+    yMax = int(np.ceil(lines[:, :, 1].max())) + 1
+    width = int(np.ceil(lines[:, :, 0].max())) + 1 - xMin
+    height = yMax - int(np.floor(lines[:, :, 1].min())) + 1
+    # move to the tile's pixels, with y pointing down
+    lines[:, :, 0] -= xMin
+    lines[:, :, 1] = yMax - lines[:, :, 1]
+    alpha = rasterizeLines(lines, width, height)
+    return Tile(alpha, -xMin, yMax, advance, tuple(fillStyle))
+
+
+class TileCache(object):
+    """
+    LRU cache of Tiles, evicting the least recently used ones when their
+    total size is above maxBytes.
+    """
+
+    def __init__(self, maxBytes=64 * 1024 * 1024):
+        self.maxBytes = maxBytes
+        self.tiles = OrderedDict()
+        self.totalBytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.tiles)
+
+    def __contains__(self, key):
+        return key in self.tiles
+
+    def get(self, key):
+        tile = self.tiles.get(key)
+        if tile is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.tiles.move_to_end(key)
+        return tile
+
+    def put(self, key, tile):
+        if key in self.tiles:
+            self.totalBytes -= self.tiles.pop(key).alpha.nbytes
+        self.tiles[key] = tile
+        self.totalBytes += tile.alpha.nbytes
+        # the tile that was just added is never evicted
+        while self.totalBytes > self.maxBytes and len(self.tiles) > 1:
+            _, oldTile = self.tiles.popitem(last=False)
+            self.totalBytes -= oldTile.alpha.nbytes
+
+    def clear(self):
+        self.tiles.clear()
+        self.totalBytes = 0
+
+    def getCombinationTile(self, previewGlyph, pointSize,
+                           fillStyle=(0, 0, 0, 1)):
+        """
+        Returns the Tile of a (defcon) preview glyph, rasterizing it only if
+        it's not in the cache. The tiles of older revisions of the
+        combination are left to be evicted.
+        """
+        layer = previewGlyph.layer
+        key = getTileKey(previewGlyph, pointSize, fillStyle)
+        tile = self.get(key)
+        if tile is None:
+            tile = rasterizeGlyph(previewGlyph, pointSize,
+                                  layer.font.info.unitsPerEm, fillStyle)
+            self.put(key, tile)
+        return tile
+
+
+def blitTile(canvas, tile, x, y):
+    """
+    Composites the tile onto an RGBA canvas (array of shape
+    (height, width, 4) with float values 0-1), with the glyph's origin
+    at column x and row y (the baseline).
+    """
+    tileHeight, tileWidth = tile.alpha.shape
+    left = int(round(x)) - tile.originX
+    top = int(round(y)) - tile.originY
+    canvasHeight, canvasWidth = canvas.shape[:2]
+    # clip the tile to the canvas
+    cropLeft, cropTop = max(0, -left), max(0, -top)
+    cropRight = min(tileWidth, canvasWidth - left)
+    cropBottom = min(tileHeight, canvasHeight - top)
+    if cropLeft >= cropRight or cropTop >= cropBottom:
+        return
+    red, green, blue, opacity = tile.fillStyle
+    alpha = tile.alpha[cropTop:cropBottom, cropLeft:cropRight, None] / 255.0
+    alpha = alpha * opacity
+    region = canvas[top + cropTop:top + cropBottom,
+                    left + cropLeft:left + cropRight]
+    region[:] = region * (1 - alpha) + np.array(
+        [red, green, blue, 1.0]) * alpha
+
+
+def renderRow(tileCache, previewGlyphsList, pointSize, fillStyle=(0, 0, 0, 1),
+              margin=10):
+    """
+    Returns an RGBA canvas with the preview glyphs set side by side.
+    """
+    tilesList = [
+        tileCache.getCombinationTile(previewGlyph, pointSize, fillStyle)
+        for previewGlyph in previewGlyphsList]
+    aboveBaseline = max([tile.originY for tile in tilesList] + [0])
+    belowBaseline = max([tile.alpha.shape[0] - tile.originY
+                         for tile in tilesList] + [0])
+    width = margin * 2 + int(np.ceil(
+        sum(tile.advance for tile in tilesList)))
+    height = margin * 2 + aboveBaseline + belowBaseline
+    canvas = np.ones((height, width, 4))
+    x = margin
+    for tile in tilesList:
+        blitTile(canvas, tile, x, margin + aboveBaseline)
+        x += tile.advance
+    return canvas
+
+
+def layoutLines(advancesList, width, margin=10):
+    """
+    Sets the items side by side, starting a new line when an item doesn't
+    fit in width. advancesList has the advance widths of the items, None
+    being a line break. Returns the list of the (x, line number) of the
+    items (None for the line breaks), and the number of lines.
+    """
+    positionsList = []
+    x, line = margin, 0
+    for advance in advancesList:
+        if advance is None:
+            positionsList.append(None)
+            x, line = margin, line + 1
+            continue
+        if x > margin and x + advance > width - margin:
+            x, line = margin, line + 1
+        positionsList.append((x, line))
+        x += advance
+    return positionsList, line + 1
+
+
+def writePNG(path, canvas):
+    """
+    Writes an RGBA canvas (array of shape (height, width, 4) with float
+    values 0-1) as a PNG file.
+    """
+    height, width = canvas.shape[:2]
+    pixels = np.round(np.clip(canvas, 0, 1) * 255).astype(np.uint8)
+    # each row starts with filter type 0 (none)
+    rows = np.concatenate(
+        [np.zeros((height, 1), dtype=np.uint8),
+         pixels.reshape(height, width * 4)], axis=1)
+
+    def chunk(chunkType, data):
+        return (struct.pack(">I", len(data)) + chunkType + data +
+                struct.pack(">I", zlib.crc32(chunkType + data) & 0xFFFFFFFF))
+
+    with open(path, "wb") as pngFile:
+        pngFile.write(b"\x89PNG\r\n\x1a\n")
+        pngFile.write(chunk(b"IHDR", struct.pack(
+            ">IIBBBBB", width, height, 8, 6, 0, 0, 0)))
+        pngFile.write(chunk(b"IDAT", zlib.compress(rows.tobytes())))
+        pngFile.write(chunk(b"IEND", b""))
@@ -0,0 +1,296 @@
+# Copyright 2015 Adobe. All rights reserved.
+
+"""
+Line view of the extension, drawn with the raster tiles of the
+combinations (see rasterTiles).
+
+Nothing is rasterized when the glyphs change: a repaint draws the cached
+images of the tiles that intersect the dirty rect, and the outlines of the
+visible glyphs whose tiles aren't cached yet (e.g. while an anchor is being
+dragged). Those tiles are rasterized once the glyphs stop changing.
+"""
+
+import time
+
+import numpy as np
+import objc
+import Quartz
+from AppKit import (NSObject, NSView, NSColor, NSData, NSRectFill,
+                    NSIntersectsRect, NSGraphicsContext, NSAffineTransform,
+                    NSViewWidthSizable)
+from fontTools.pens.cocoaPen import CocoaPen
+from vanilla import ScrollView
+
+from rasterTiles import TileCache, getTileKey, layoutLines
+
+# returned by createNewLineGlyph; starts a new line
+NEW_LINE_GLYPH = object()
+MARGIN = 10
+FILL_STYLE = (0, 0, 0, 1)
+# seconds without changes after which the missing tiles are rasterized
+RASTERIZE_DELAY = .3
+# seconds spent rasterizing before handling the events again
+RASTERIZE_TIME = .05
+
+
+def makeTileImage(tile):
+    """
+    Returns the tile as a CGImage, filled with the tile's fill style.
+    """
+    height, width = tile.alpha.shape
+    # glyphs without outlines
+    if not width or not height:
+        return None
+    red, green, blue, opacity = tile.fillStyle
+    alpha = tile.alpha / 255.0 * opacity
+    # premultiplied RGBA
+    pixels = np.empty((height, width, 4))
+    pixels[:, :, 0] = red * alpha
+    pixels[:, :, 1] = green * alpha
+    pixels[:, :, 2] = blue * alpha
+    pixels[:, :, 3] = alpha
+    data = np.round(pixels * 255).astype(np.uint8).tobytes()
+    # NSData copies the bytes, so the image doesn't depend on them
+    provider = Quartz.CGDataProviderCreateWithCFData(
+        NSData.dataWithBytes_length_(data, len(data)))
+    colorSpace = Quartz.CGColorSpaceCreateDeviceRGB()
+    return Quartz.CGImageCreate(
+        width, height, 8, 32, width * 4, colorSpace,
+        Quartz.kCGImageAlphaPremultipliedLast, provider, None, False,
+        Quartz.kCGRenderingIntentDefault)
+
+
+class TileLineNSView(NSView):
+
+    def initWithTileCache_(self, tileCache):
+        self = objc.super(TileLineNSView, self).initWithFrame_(
+            ((0, 0), (400, 400)))
+        if self is None:
+            return None
+        self.tileCache = tileCache
+        self.glyphsList = []
+        self.pointSize = 150
+        self.lineHeight = 200
+        self.unitsPerEm = 1000
+        self.ascender = 750
+        # tile key of each glyph; None for the line breaks
+        self.tileKeysList = []
+        # key: tile key -- value: (tile, CGImage)
+        self.imagesDict = {}
+        # (glyph index, x, baseline, rect the glyph is drawn in) tuples
+        self.placedGlyphsList = []
+        # indexes of the glyphs drawn without their tile
+        self.pendingIndexesSet = set()
+        self.setAutoresizingMask_(NSViewWidthSizable)
+        return self
+
+    def isOpaque(self):
+        return True
+
+    @objc.python_method
+    def getBackingScale(self):
+        window = self.window()
+        if window is None:
+            return 1.0
+        return window.backingScaleFactor()
+
+    @objc.python_method
+    def setFontInfo(self, unitsPerEm, ascender):
+        self.unitsPerEm = unitsPerEm or 1000
+        self.ascender = ascender or self.unitsPerEm * .75
+        self.imagesDict.clear()
+        self.reloadTiles()
+
+    @objc.python_method
+    def setGlyphs(self, glyphsList):
+        # fontParts glyphs wrap the defcon glyphs
+        self.glyphsList = [
+            glyph.naked() if hasattr(glyph, "naked") else glyph
+            for glyph in glyphsList]
+        self.reloadTiles()
+
+    @objc.python_method
+    def setPointSizeAndLineHeight(self, pointSize, lineHeight):
+        self.pointSize = pointSize
+        self.lineHeight = lineHeight
+        self.reloadTiles()
+
+    def viewDidChangeBackingProperties(self):
+        self.reloadTiles()
+
+    @objc.python_method
+    def getPixelSize(self):
+        return self.pointSize * self.getBackingScale()
+
+    @objc.python_method
+    def reloadTiles(self):
+        """
+        Looks up the keys of the glyphs' tiles, at the resolution of the
+        screen. The tiles are only looked up when they're drawn.
+        """
+        pixelSize = self.getPixelSize()
+        self.tileKeysList = [
+            None if glyph is NEW_LINE_GLYPH else
+            getTileKey(glyph, pixelSize, FILL_STYLE)
+            for glyph in self.glyphsList]
+        # only the images of the tiles in use are kept
+        self.imagesDict = dict(
+            (key, self.imagesDict[key]) for key in self.tileKeysList
+            if key in self.imagesDict)
+        self.pendingIndexesSet.clear()
+        self.layoutTiles(self.frame().size.width)
+
+    @objc.python_method
+    def layoutTiles(self, width):
+        """
+        Places the glyphs, and sets the height of the view.
+        """
+        upmScale = float(self.pointSize) / self.unitsPerEm
+        advancesList = [
+            None if glyph is NEW_LINE_GLYPH else glyph.width * upmScale
+            for glyph in self.glyphsList]
+        positionsList, linesCount = layoutLines(advancesList, width, MARGIN)
+        lineAdvance = self.pointSize + self.lineHeight * upmScale
+        ascent = self.ascender * upmScale
+
+        height = MARGIN * 2 + lineAdvance * linesCount
+        superview = self.superview()
+        if superview is not None:
+            height = max(height, superview.bounds().size.height)
+        objc.super(TileLineNSView, self).setFrameSize_((width, height))
+
+        self.placedGlyphsList = []
+        for index, position in enumerate(positionsList):
+            if position is None:
+                continue
+            x, line = position
+            # the view's y axis points up
+            top = height - (MARGIN + lineAdvance * line)
+            # the outlines can overhang the advance width, and the line
+            rect = ((x - self.pointSize, top - lineAdvance - self.pointSize),
+                    (advancesList[index] + self.pointSize * 2,
+                     lineAdvance + self.pointSize * 2))
+            self.placedGlyphsList.append((index, x, top - ascent, rect))
+        self.setNeedsDisplay_(True)
+
+    def setFrameSize_(self, size):
+        # the lines are wrapped again when the width changes
+        if getattr(self, "glyphsList", None) is None:
+            objc.super(TileLineNSView, self).setFrameSize_(size)
+            return
+        self.layoutTiles(size[0])
+
+    @objc.python_method
+    def getTileImage(self, index):
+        """
+        Returns the (tile, CGImage) of the glyph, or None if its tile
+        isn't in the cache.
+        """
+        key = self.tileKeysList[index]
+        tileImage = self.imagesDict.get(key)
+        if tileImage is None:
+            tile = self.tileCache.get(key)
+            if tile is None:
+                return None
+            tileImage = self.imagesDict[key] = (tile, makeTileImage(tile))
+        return tileImage
+
+    @objc.python_method
+    def drawTileImage(self, context, tileImage, x, baseline):
+        tile, image = tileImage
+        # glyphs without outlines
+        if image is None:
+            return
+        scale = self.getBackingScale()
+        tileHeight, tileWidth = tile.alpha.shape
+        rect = ((x - tile.originX / scale,
+                 baseline + (tile.originY - tileHeight) / scale),
+                (tileWidth / scale, tileHeight / scale))
+        Quartz.CGContextDrawImage(context, rect, image)
+
+    @objc.python_method
+    def drawOutlines(self, glyph, x, baseline):
+        pen = CocoaPen(glyph.layer)
+        glyph.draw(pen)
+        upmScale = float(self.pointSize) / self.unitsPerEm
+        transform = NSAffineTransform.transform()
+        transform.translateXBy_yBy_(x, baseline)
+        transform.scaleBy_(upmScale)
+        path = transform.transformBezierPath_(pen.path)
+        NSColor.colorWithCalibratedRed_green_blue_alpha_(
+            *FILL_STYLE).set()
+        path.fill()
+
+    def drawRect_(self, rect):
+        NSColor.whiteColor().set()
+        NSRectFill(rect)
+        context = NSGraphicsContext.currentContext().CGContext()
+        pendingCount = len(self.pendingIndexesSet)
+        for index, x, baseline, glyphRect in self.placedGlyphsList:
+            if not NSIntersectsRect(glyphRect, rect):
+                continue
+            tileImage = self.getTileImage(index)
+            if tileImage is None:
+                self.drawOutlines(self.glyphsList[index], x, baseline)
+                self.pendingIndexesSet.add(index)
+            else:
+                self.drawTileImage(context, tileImage, x, baseline)
+        if len(self.pendingIndexesSet) > pendingCount:
+            # wait for the glyphs to stop changing
+            NSObject.cancelPreviousPerformRequestsWithTarget_selector_object_(
+                self, "rasterizePendingTiles:", None)
+            self.performSelector_withObject_afterDelay_(
+                "rasterizePendingTiles:", None, RASTERIZE_DELAY)
+
+    def rasterizePendingTiles_(self, sender):
+        # a few tiles at a time, so that the events are still handled
+        pixelSize = self.getPixelSize()
+        startTime = time.time()
+        for index in sorted(self.pendingIndexesSet):
+            self.tileCache.getCombinationTile(
+                self.glyphsList[index], pixelSize, FILL_STYLE)
+            self.pendingIndexesSet.discard(index)
+            if time.time() - startTime > RASTERIZE_TIME:
+                break
+        if self.pendingIndexesSet:
+            self.performSelector_withObject_afterDelay_(
+                "rasterizePendingTiles:", None, 0)
+        self.setNeedsDisplay_(True)
+
+
+class TileLineView(ScrollView):
+    """
+    A vertically scrolling view of glyphs, wrapped in lines, with the
+    methods of the MultiLineView used by the extension.
+    """
+
+    def __init__(self, posSize, pointSize=150, lineHeight=200,
+                 tileCache=None):
+        if tileCache is None:
+            tileCache = TileCache()
+        self._tileView = TileLineNSView.alloc().initWithTileCache_(tileCache)
+        self._tileView.setPointSizeAndLineHeight(pointSize, lineHeight)
+        ScrollView.__init__(self, posSize, self._tileView,
+                            hasHorizontalScroller=False,
+                            autohidesScrollers=True)
+
+    def getTileCache(self):
+        return self._tileView.tileCache
+
+    def setFont(self, font):
+        # the tiles of the previous font are left to be evicted
+        self._tileView.setFontInfo(font.info.unitsPerEm, font.info.ascender)
+
+    def set(self, glyphsList):
+        self._tileView.setGlyphs(glyphsList)
+
+    def setPointSize(self, pointSize):
+        self._tileView.setPointSizeAndLineHeight(
+            pointSize, self._tileView.lineHeight)
+
+    def setLineHeight(self, lineHeight):
+        self._tileView.setPointSizeAndLineHeight(
+            self._tileView.pointSize, lineHeight)
+
+    def createNewLineGlyph(self):
+        return NEW_LINE_GLYPH
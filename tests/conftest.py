@@ -0,0 +1,11 @@
+"""
+The modules of the extension are imported the way RoboFont imports them,
+from the extension's lib folder.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "AdjustAnchors.roboFontExt", "lib"))
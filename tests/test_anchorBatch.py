@@ -0,0 +1,107 @@
+"""
+Batch edits of an anchor class, on defcon fonts.
+"""
+
+import pytest
+from defcon import Font
+
+from anchorBatch import (ALIGN_MODE, MOVE_MODE, applyAnchorPositions,
+                         computeAnchorPositions, getAnchorClassGlyphNames,
+                         getGlyphAnchor)
+
+
+def makeBatchFont():
+    font = Font()
+    font.info.xHeight = 500
+    for glyphName, position in [("a", (250, 480)), ("e", (260, 510)),
+                                ("o", (255, 500))]:
+        glyph = font.newGlyph(glyphName)
+        glyph.appendAnchor({"name": "top", "x": position[0],
+                            "y": position[1]})
+        glyph.appendAnchor({"name": "bottom", "x": position[0], "y": 0})
+    font.newGlyph("space")
+    return font
+
+
+def getPositions(font, anchorName="top"):
+    return dict((glyph.name, (anchor.x, anchor.y)) for glyph in font
+                for anchor in [getGlyphAnchor(glyph, anchorName)]
+                if anchor is not None)
+
+
+class ChangedCounter(object):
+
+    def __init__(self, font):
+        self.count = 0
+        font.addObserver(self, "fontChanged", "Font.Changed")
+
+    def fontChanged(self, notification):
+        self.count += 1
+
+
+def test_getAnchorClassGlyphNames():
+    font = makeBatchFont()
+    assert getAnchorClassGlyphNames(font, "top") == ["a", "e", "o"]
+    assert getAnchorClassGlyphNames(font, "ogonek") == []
+
+
+def test_computeAnchorPositions():
+    font = makeBatchFont()
+    before = getPositions(font)
+    assert computeAnchorPositions(
+        font, ["a", "e", "space"], "top", MOVE_MODE, (10, -5)) == {
+            "a": ((250, 480), (260, 475)), "e": ((260, 510), (270, 505))}
+    # the glyphs already on the metric are left out
+    assert computeAnchorPositions(
+        font, ["a", "e", "o"], "top", ALIGN_MODE,
+        metricName="xHeight") == {
+            "a": ((250, 480), (250, 500)), "e": ((260, 510), (260, 500))}
+    assert getPositions(font) == before
+    with pytest.raises(ValueError):
+        computeAnchorPositions(font, ["a"], "top", "rotate")
+
+
+def test_applyAnchorPositions_undo():
+    font = makeBatchFont()
+    before = getPositions(font)
+    positionsDict = computeAnchorPositions(
+        font, font.glyphOrder, "top", MOVE_MODE, (0, 20))
+    undoPositionsDict, skippedNamesList = applyAnchorPositions(
+        font, "top", positionsDict)
+    assert skippedNamesList == []
+    assert getPositions(font) == dict(
+        (name, (x, y + 20)) for name, (x, y) in before.items())
+    # the other anchors are left alone
+    assert getPositions(font, "bottom") == dict(
+        (name, (x, 0)) for name, (x, y) in before.items())
+
+    redoPositionsDict, skippedNamesList = applyAnchorPositions(
+        font, "top", undoPositionsDict)
+    assert skippedNamesList == []
+    assert getPositions(font) == before
+    assert redoPositionsDict == positionsDict
+
+
+def test_applyAnchorPositions_editedSince():
+    font = makeBatchFont()
+    positionsDict = computeAnchorPositions(
+        font, font.glyphOrder, "top", MOVE_MODE, (0, 20))
+    undoPositionsDict, skippedNamesList = applyAnchorPositions(
+        font, "top", positionsDict)
+    # the anchor is edited after the batch
+    getGlyphAnchor(font["e"], "top").y = 600
+
+    _, skippedNamesList = applyAnchorPositions(
+        font, "top", undoPositionsDict)
+    assert skippedNamesList == ["e"]
+    assert getPositions(font) == {
+        "a": (250, 480), "e": (260, 600), "o": (255, 500)}
+
+
+def test_applyAnchorPositions_notifications():
+    font = makeBatchFont()
+    counter = ChangedCounter(font)
+    positionsDict = computeAnchorPositions(
+        font, font.glyphOrder, "top", MOVE_MODE, (5, 5))
+    applyAnchorPositions(font, "top", positionsDict)
+    assert counter.count == 1
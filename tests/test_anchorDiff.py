@@ -0,0 +1,100 @@
+"""
+Diff of the attachments of two revisions of a UFO.
+"""
+
+from defcon import Font
+
+from anchorDiff import (ADDED, BROKEN, FIXED, MOVED, REMOVED, diffRecords,
+                        diffUFOs)
+from glyphRecords import readGlyphRecords
+
+# key: glyph name -- value: list of (anchor name, x, y)
+OLD_ANCHORS = {
+    "o": [("top", 250, 500), ("bottom", 250, 0)],
+    "e": [("top", 260, 500)],
+    "u": [],
+    "acute": [("_top", 100, 450)],
+    "cedilla": [("_bottom", 100, 0)],
+    "tilde": [("_bottom", 100, 0)],
+}
+
+
+def saveFont(path, anchorsDict):
+    font = Font()
+    for glyphName, anchorsList in anchorsDict.items():
+        glyph = font.newGlyph(glyphName)
+        glyph.width = 500
+        for name, x, y in anchorsList:
+            glyph.appendAnchor({"name": name, "x": x, "y": y})
+    font.save(path)
+    return path
+
+
+def makeRevisions(tmpdir):
+    newAnchorsDict = dict(OLD_ANCHORS)
+    # the acute moves by 30 units, the cedilla by 5
+    newAnchorsDict["acute"] = [("_top", 100, 420)]
+    newAnchorsDict["cedilla"] = [("_bottom", 95, 0)]
+    # the grave is added, the tilde is removed
+    newAnchorsDict["grave"] = [("_top", 120, 450)]
+    del newAnchorsDict["tilde"]
+    # e loses its anchor, u gets one
+    newAnchorsDict["e"] = []
+    newAnchorsDict["u"] = [("top", 240, 500)]
+    oldPath = saveFont(str(tmpdir.join("old.ufo")), OLD_ANCHORS)
+    newPath = saveFont(str(tmpdir.join("new.ufo")), newAnchorsDict)
+    return oldPath, newPath
+
+
+def getStatusesDict(changesList):
+    return dict(((change["base"], change["mark"]), change["status"])
+                for change in changesList)
+
+
+def test_diffUFOs_statuses(tmpdir):
+    changesList = diffUFOs(*makeRevisions(tmpdir))
+    assert getStatusesDict(changesList) == {
+        ("o", "acute"): MOVED,
+        ("o", "cedilla"): MOVED,
+        ("o", "grave"): ADDED,
+        ("u", "grave"): ADDED,
+        ("o", "tilde"): REMOVED,
+        ("e", "acute"): BROKEN,
+        ("u", "acute"): FIXED,
+    }
+    changesDict = dict(((change["base"], change["mark"]), change)
+                       for change in changesList)
+    moved = changesDict[("o", "acute")]
+    assert moved["old"] == (150, 50) and moved["new"] == (150, 80)
+    assert moved["shift"] == (0, 30) and moved["distance"] == 30
+    assert changesDict[("u", "acute")]["old"] is None
+    assert changesDict[("e", "acute")]["new"] is None
+
+
+def test_diffUFOs_ranking(tmpdir):
+    changesList = diffUFOs(*makeRevisions(tmpdir))
+    # the combinations that appeared, disappeared or broke come first,
+    # then the ones that moved the most
+    assert [(change["base"], change["mark"]) for change in changesList] == [
+        ("e", "acute"), ("o", "grave"), ("o", "tilde"), ("u", "acute"),
+        ("u", "grave"), ("o", "acute"), ("o", "cedilla")]
+
+
+def test_diffUFOs_unchanged(tmpdir):
+    oldPath = saveFont(str(tmpdir.join("old.ufo")), OLD_ANCHORS)
+    assert diffUFOs(oldPath, oldPath) == []
+
+
+def test_readGlyphRecords_reuse(tmpdir):
+    oldPath, newPath = makeRevisions(tmpdir)
+    oldRecords = readGlyphRecords(oldPath)
+    newRecords = readGlyphRecords(newPath, oldRecords)
+    # the unchanged .glif files are not parsed again
+    assert newRecords["o"] is oldRecords["o"]
+    for glyphName in ["acute", "cedilla", "e", "u"]:
+        assert newRecords[glyphName] is not oldRecords[glyphName]
+        assert newRecords.hashesDict[glyphName] != (
+            oldRecords.hashesDict[glyphName])
+    assert newRecords.glyphOrder == ["o", "e", "u", "acute", "cedilla",
+                                     "grave"]
+    assert diffRecords(oldRecords, newRecords) == diffUFOs(oldPath, newPath)
@@ -0,0 +1,104 @@
+"""
+Checks of the compiled GPOS against the UFO's anchors.
+"""
+
+import os
+
+from defcon import Font
+from fontTools.feaLib.builder import addOpenTypeFeaturesFromString
+from fontTools.fontBuilder import FontBuilder
+from fontTools.pens.ttGlyphPen import TTGlyphPen
+
+from anchorGPOS import OFFSET_MISMATCH, verifyFont
+
+FEATURES = """
+markClass acute <anchor 0 450> @TOP;
+lookup base {
+    pos base o <anchor 250 500> mark @TOP;
+    pos base e <anchor 260 500> mark @TOP;
+} base;
+%s
+feature mark {
+    lookup base;
+%s
+} mark;
+"""
+
+
+def makeFonts(directory, extraFeatures="", extraLookups="",
+              extraAnchorsDict=None):
+    ufo = Font()
+    ufo.info.unitsPerEm = 1000
+    for glyphName, x in (("o", 250), ("e", 260)):
+        glyph = ufo.newGlyph(glyphName)
+        glyph.width = 500
+        glyph.appendAnchor({"name": "top", "x": x, "y": 500})
+    # only has contextual anchors, if any
+    ufo.newGlyph("i").width = 500
+    for glyphName, anchorsList in (extraAnchorsDict or {}).items():
+        for name, x, y in anchorsList:
+            ufo[glyphName].appendAnchor({"name": name, "x": x, "y": y})
+    ufo.newGlyph("acute").appendAnchor({"name": "_top", "x": 0, "y": 450})
+    ufoPath = os.path.join(str(directory), "test.ufo")
+    ufo.save(ufoPath)
+
+    glyphOrder = [".notdef", "o", "e", "i", "acute"]
+    builder = FontBuilder(1000, isTTF=True)
+    builder.setupGlyphOrder(glyphOrder)
+    builder.setupCharacterMap({})
+    emptyGlyph = TTGlyphPen(None).glyph()
+    builder.setupGlyf(dict((name, emptyGlyph) for name in glyphOrder))
+    builder.setupHorizontalMetrics(
+        dict((name, (500, 0)) for name in glyphOrder))
+    builder.setupHorizontalHeader()
+    builder.setupPost()
+    addOpenTypeFeaturesFromString(builder.font, FEATURES % (extraLookups, extraFeatures))
+    fontPath = os.path.join(str(directory), "test.ttf")
+    builder.save(fontPath)
+    return ufoPath, fontPath
+
+
+def test_matchingFont(tmpdir):
+    ufoPath, fontPath = makeFonts(tmpdir)
+    assert list(verifyFont(ufoPath, fontPath)) == []
+
+
+def test_laterLookupOverrides(tmpdir):
+    # a later lookup attaches the mark again, so it wins
+    ufoPath, fontPath = makeFonts(
+        tmpdir, "    lookup OVR { pos base o <anchor 300 500> mark @TOP; "
+                "} OVR;")
+    mismatchesList = list(verifyFont(ufoPath, fontPath))
+    assert len(mismatchesList) == 1
+    mismatch = mismatchesList[0]
+    assert mismatch["check"] == OFFSET_MISMATCH
+    assert (mismatch["base"], mismatch["mark"]) == ("o", "acute")
+    assert mismatch["gpos"] == [300, 50]
+    assert mismatch["ufo"] == [250, 50]
+
+
+def test_firstSubtableWins(tmpdir):
+    # within a lookup, the first subtable that covers the pair applies
+    ufoPath, fontPath = makeFonts(
+        tmpdir, "    lookup SUB { pos base o <anchor 250 500> mark @TOP; "
+                "subtable; pos base o <anchor 300 500> mark @TOP; } SUB;")
+    assert list(verifyFont(ufoPath, fontPath)) == []
+
+
+def test_contextualLookups(tmpdir):
+    # the lookups of the contextual anchors are only reached thru a
+    # contextual rule, and don't override the plain attachments
+    ufoPath, fontPath = makeFonts(
+        tmpdir, "    pos [o]' lookup CXT1 acute e;",
+        "lookup CXT1 { pos base o <anchor 400 600> mark @TOP; } CXT1;",
+        {"o": [("topCXT1", 400, 600)]})
+    assert list(verifyFont(ufoPath, fontPath)) == []
+
+
+def test_contextualOnlyBase(tmpdir):
+    # a base that only has a contextual anchor isn't missing in the UFO
+    ufoPath, fontPath = makeFonts(
+        tmpdir, "    pos [i]' lookup CXT1 acute o;",
+        "lookup CXT1 { pos base i <anchor 250 600> mark @TOP; } CXT1;",
+        {"i": [("topCXT1", 250, 600)]})
+    assert list(verifyFont(ufoPath, fontPath)) == []
@@ -0,0 +1,162 @@
+"""
+The AnchorIndex must give the same offsets and the same lists of
+combinations as the code of the extension it replaced.
+"""
+
+import random
+
+import pytest
+from defcon import Font
+
+from anchorIndex import AnchorIndex
+
+ANCHOR_NAMES = ["top", "bottom", "_top", "_bottom", "topCXT1", "topCXT2",
+                "ogonek", "_ogonek"]
+
+
+def referenceAnchorOffsets(marksDict, canvasGlyph, glyphToDraw,
+                           anchorNameCXTportion=''):
+    """
+    AdjustAnchors.getAnchorOffsets, as it was before the AnchorIndex.
+    """
+    # the current glyph is a mark
+    if canvasGlyph.name in marksDict:
+        # glyphToDraw is also a mark (mark-to-mark case)
+        if glyphToDraw.name in marksDict:
+            # pick the (mark glyph) anchor to draw on
+            for anchor in canvasGlyph.anchors:
+                if anchor.name[0] != '_':
+                    anchorName = anchor.name
+                    markAnchor = anchor
+                    break
+            # pick the (base glyph) anchor to draw on
+            for anchor in glyphToDraw.anchors:
+                try:
+                    if anchor.name == '_' + anchorName:
+                        baseAnchor = anchor
+                        break
+                except UnboundLocalError:
+                    continue
+        # glyphToDraw is not a mark
+        else:
+            # pick the (mark glyph) anchor to draw on
+            for anchor in canvasGlyph.anchors:
+                if anchor.name[0] == '_':
+                    anchorName = anchor.name[1:]
+                    markAnchor = anchor
+                    break
+            # pick the (base glyph) anchor to draw on
+            for anchor in glyphToDraw.anchors:
+                try:
+                    if anchor.name == anchorName:
+                        baseAnchor = anchor
+                        break
+                except UnboundLocalError:
+                    continue
+
+        try:
+            offsetX = markAnchor.x - baseAnchor.x
+            offsetY = markAnchor.y - baseAnchor.y
+        except UnboundLocalError:
+            offsetX = 0
+            offsetY = 0
+
+    # the current glyph is a base
+    else:
+        try:
+            anchorName = marksDict[glyphToDraw.name]
+        except KeyError:
+            anchorName = None
+
+        if anchorName:
+            # pick the (base glyph) anchor to draw on
+            for anchor in canvasGlyph.anchors:
+                if anchor.name == anchorName + anchorNameCXTportion:
+                    baseAnchor = anchor
+                    break
+            # pick the (mark glyph) anchor to draw on
+            for anchor in glyphToDraw.anchors:
+                if anchor.name == '_' + anchorName:
+                    markAnchor = anchor
+                    break
+
+        try:
+            offsetX = baseAnchor.x - markAnchor.x
+            offsetY = baseAnchor.y - markAnchor.y
+        except UnboundLocalError:
+            offsetX = 0
+            offsetY = 0
+
+    return (offsetX, offsetY)
+
+
+def referenceMarksDict(font):
+    """
+    The marksDict of AdjustAnchors.fillAnchorsAndMarksDicts, as it was
+    before the AnchorIndex.
+    """
+    marksDict = {}
+    for glyphName in font.glyphOrder:
+        for anchor in font[glyphName].anchors:
+            if anchor.name[0] == '_' and glyphName not in marksDict:
+                marksDict[glyphName] = anchor.name[1:]
+    return marksDict
+
+
+def makeRandomFont(seed, glyphCount=30):
+    randomizer = random.Random(seed)
+    font = Font()
+    for i in range(glyphCount):
+        glyph = font.newGlyph("glyph%d" % i)
+        for _ in range(randomizer.randint(0, 4)):
+            glyph.appendAnchor({
+                "name": randomizer.choice(ANCHOR_NAMES),
+                "x": randomizer.randint(-500, 500),
+                "y": randomizer.randint(-500, 1000)})
+    # the contextual anchors need a mark of their class
+    font.newGlyph("topmark").appendAnchor({"name": "_top", "x": 5, "y": 7})
+    return font
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_getAnchorOffsets(seed):
+    font = makeRandomFont(seed)
+    index = AnchorIndex(font)
+    marksDict = referenceMarksDict(font)
+    assert index.marksDict == marksDict
+    for canvasGlyph in font:
+        for glyphToDraw in font:
+            for anchorNameCXTportion in ['', 'CXT1', 'CXT2']:
+                assert index.getAnchorOffsets(
+                    canvasGlyph, glyphToDraw, anchorNameCXTportion) == (
+                    referenceAnchorOffsets(
+                        marksDict, canvasGlyph, glyphToDraw,
+                        anchorNameCXTportion))
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_getAnchorOffsets_previewNames(seed):
+    # the offsets of the combinations listed by the extension
+    font = makeRandomFont(seed)
+    index = AnchorIndex(font)
+    for glyph in font:
+        for previewName in index.getPreviewNames(glyph):
+            glyphName, _, contextualNumber = previewName.partition("CXT")
+            anchorNameCXTportion = (
+                "CXT" + contextualNumber if contextualNumber else '')
+            assert index.getAnchorOffsets(
+                glyph, font[glyphName], anchorNameCXTportion) == (
+                referenceAnchorOffsets(
+                    index.marksDict, glyph, font[glyphName],
+                    anchorNameCXTportion))
+
+
+def test_unnamedAnchors():
+    font = makeRandomFont(0)
+    glyph = font["topmark"]
+    glyph.appendAnchor({"x": 0, "y": 0})
+    index = AnchorIndex(font)
+    assert index.marksDict["topmark"] == "top"
+    index.getPreviewNames(glyph)
+    for otherGlyph in font:
+        index.getAnchorOffsets(glyph, otherGlyph)
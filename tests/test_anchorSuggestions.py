@@ -0,0 +1,95 @@
+"""
+The outlines read from the contours' points must have the same bounds as
+the outlines drawn with a pen.
+"""
+
+import pytest
+from defcon import Font
+from fontTools.pens.boundsPen import BoundsPen
+
+import anchorSuggestions
+from anchorSuggestions import (BOUNDS_CENTER_MODE, AnchorSuggestionEngine,
+                               cubicSegmentsFactory, drawCubicSegments)
+
+
+def drawPoints(glyph, contoursList):
+    pen = glyph.getPointPen()
+    for contour in contoursList:
+        pen.beginPath()
+        for point, segmentType in contour:
+            pen.addPoint(point, segmentType)
+        pen.endPath()
+
+
+def makeOutlineFont():
+    font = Font()
+    drawPoints(font.newGlyph("square"), [
+        [((0, 0), "line"), ((0, 500), "line"), ((400, 500), "line"),
+         ((400, 0), "line")]])
+    # the contour starts with the off-curve points of the curve
+    # which comes from its last point
+    drawPoints(font.newGlyph("o"), [
+        [((300, 700), None), ((-50, 700), None), ((0, 0), "curve"),
+         ((500, 0), "line"), ((500, 300), "line")]])
+    # an open contour
+    drawPoints(font.newGlyph("stroke"), [
+        [((0, 0), "move"), ((100, 300), None), ((200, -100), None),
+         ((300, 0), "curve")]])
+    drawPoints(font.newGlyph("quadratic"), [
+        [((0, 0), "line"), ((250, 600), None), ((500, 0), "qcurve")]])
+    font.newGlyph("composite").getPen().addComponent(
+        "o", (0.5, 0, 0.2, 1, 100, 50))
+    font.newGlyph("nested").getPen().addComponent(
+        "composite", (1, 0, 0, -1, 0, 700))
+    font.newGlyph("space")
+    for glyph in font:
+        glyph.appendAnchor({"name": "top", "x": 0, "y": 700})
+    return font
+
+
+def getBounds(glyph):
+    pen = BoundsPen(glyph.layer)
+    glyph.draw(pen)
+    return pen.bounds
+
+
+@pytest.mark.parametrize("glyphName", [
+    "square", "o", "stroke", "quadratic", "composite", "nested"])
+def test_cubicSegmentsFactory(glyphName, monkeypatch):
+    font = makeOutlineFont()
+    glyph = font[glyphName]
+    # only the quadratic curves are drawn with the pen
+    drawnNamesList = []
+
+    def drawWithPen(glyph):
+        drawnNamesList.append(glyph.name)
+        return drawCubicSegments(glyph)
+
+    monkeypatch.setattr(anchorSuggestions, "drawCubicSegments", drawWithPen)
+    extrema = AnchorSuggestionEngine(font).getOutlineExtrema([glyphName])[0]
+    assert extrema == pytest.approx(getBounds(glyph))
+    # the same segments as the pen, but the closing lines of zero length
+    segmentsList = cubicSegmentsFactory(glyph)
+    assert len(segmentsList) % 8 == 0
+    assert len(segmentsList) >= len(drawCubicSegments(glyph))
+    assert set(drawnNamesList) <= set(["quadratic"])
+    assert bool(drawnNamesList) == (glyphName == "quadratic")
+
+
+def test_suggestAnchorPositions():
+    font = makeOutlineFont()
+    positionsDict = AnchorSuggestionEngine(font).suggestAnchorPositions(
+        "top", BOUNDS_CENTER_MODE)
+    assert positionsDict["square"] == ((0, 700), (200, 700))
+    assert "space" not in positionsDict
+    assert set(positionsDict) == set(font.keys()) - set(["space"])
+
+
+def test_baseGlyphChanged():
+    font = makeOutlineFont()
+    engine = AnchorSuggestionEngine(font)
+    before = engine.getOutlineExtrema(["nested"])[0]
+    font["o"].move((100, 0))
+    after = engine.getOutlineExtrema(["nested"])[0]
+    assert after[0] == pytest.approx(before[0] + 50)
+    assert after == pytest.approx(getBounds(font["nested"]))
@@ -0,0 +1,92 @@
+"""
+Counting of the combinations in text corpora.
+"""
+
+import unicodedata
+
+import pytest
+from defcon import Font
+
+import combinationFrequency
+from combinationFrequency import (countCorpora, countSequences,
+                                  initCounting, makeCharacterTables)
+from glyphRecords import readGlyphRecords
+
+# (glyph name, code point, anchors)
+GLYPHS = [
+    ("o", 0x006F, [("top", 250, 500), ("bottom", 250, 0)]),
+    ("e", 0x0065, [("top", 260, 500), ("bottom", 260, 0)]),
+    ("acutecomb", 0x0301, [("_top", 0, 450), ("top", 0, 650)]),
+    ("gravecomb", 0x0300, [("_top", 0, 450), ("top", 0, 650)]),
+    ("dotbelowcomb", 0x0323, [("_bottom", 0, 0), ("bottom", 0, -100)]),
+]
+
+
+@pytest.fixture(scope="module")
+def ufoPath(tmpdir_factory):
+    font = Font()
+    for glyphName, codePoint, anchorsList in GLYPHS:
+        glyph = font.newGlyph(glyphName)
+        glyph.unicodes = [codePoint]
+        for name, x, y in anchorsList:
+            glyph.appendAnchor({"name": name, "x": x, "y": y})
+    path = str(tmpdir_factory.mktemp("ufo").join("test.ufo"))
+    font.save(path)
+    return path
+
+
+@pytest.fixture(scope="module")
+def glyphNamesList(ufoPath):
+    glyphNamesList, cmapDict, markClassesDict, stackClassesDict = (
+        makeCharacterTables(readGlyphRecords(ufoPath)))
+    initCounting(cmapDict, markClassesDict, stackClassesDict,
+                 len(glyphNamesList))
+    return glyphNamesList
+
+
+def count(glyphNamesList, text, blockSize=1024):
+    pairs, counts = countSequences(
+        unicodedata.normalize("NFD", text), combinationFrequency._charTable,
+        combinationFrequency._markClasses,
+        combinationFrequency._stackClasses, blockSize)
+    return dict(
+        ((glyphNamesList[baseID], glyphNamesList[markID]), count)
+        for (baseID, markID), count in zip(pairs.tolist(), counts.tolist()))
+
+
+def test_countSequences(glyphNamesList):
+    assert count(glyphNamesList, u"ó é\nòx́") == {
+        ("o", "acutecomb"): 1, ("e", "acutecomb"): 1,
+        ("o", "gravecomb"): 1}
+
+
+def test_countSequences_stacks(glyphNamesList):
+    # the acute stacks on the grave, but not on the dot below
+    assert count(glyphNamesList, u"ò́ ọ́") == {
+        ("o", "gravecomb"): 1, ("gravecomb", "acutecomb"): 1,
+        ("o", "acutecomb"): 2, ("o", "dotbelowcomb"): 1}
+
+
+def test_countSequences_start(glyphNamesList):
+    # the marks that don't follow a base aren't counted
+    assert count(glyphNamesList, u"́ x́ e") == {}
+
+
+@pytest.mark.parametrize("blockSize", [1, 2, 3, 5])
+def test_countSequences_blocks(glyphNamesList, blockSize):
+    # the combinations across the edges of the blocks are counted
+    text = u"ò́́ ẹ́ ́ọò"
+    assert count(glyphNamesList, text, blockSize) == count(
+        glyphNamesList, text)
+    assert count(glyphNamesList, u"è́", 1) == {
+        ("e", "gravecomb"): 1, ("e", "acutecomb"): 1,
+        ("gravecomb", "acutecomb"): 1}
+
+
+def test_countCorpora(ufoPath, tmpdir):
+    corpusPath = tmpdir.join("corpus.txt")
+    corpusPath.write_text(u"óó\nè\n" * 100, encoding="utf-8")
+    frequencies = countCorpora(ufoPath, [str(corpusPath)], processes=1,
+                               chunkSize=10)
+    assert frequencies.countsDict == {
+        ("o", "acutecomb"): 200, ("e", "gravecomb"): 100}
@@ -0,0 +1,71 @@
+"""
+The MarkStackAssembler must enumerate every chain of marks, taking turns
+between the first marks.
+"""
+
+from itertools import islice
+
+from defcon import Font
+
+from anchorIndex import AnchorIndex
+from markStacks import MarkStackAssembler
+
+
+def makeStackFont(markCount=3):
+    """
+    A base with a top anchor, and marks which attach to it and to
+    each other.
+    """
+    font = Font()
+    base = font.newGlyph("a")
+    base.appendAnchor({"name": "top", "x": 250, "y": 500})
+    for i in range(markCount):
+        mark = font.newGlyph("mark%d" % i)
+        mark.appendAnchor({"name": "_top", "x": 0, "y": 400})
+        mark.appendAnchor({"name": "top", "x": 0, "y": 600 + i * 10})
+    return font
+
+
+def makeAssembler(font):
+    return MarkStackAssembler(font, AnchorIndex(font))
+
+
+def test_iterMarkStacks_all():
+    assembler = makeAssembler(makeStackFont())
+    chainsList = list(assembler.iterMarkStacks("a", 2))
+    markNamesList = ["mark0", "mark1", "mark2"]
+    expectedChainsSet = set(
+        [("a", name) for name in markNamesList] +
+        [("a", name1, name2)
+         for name1 in markNamesList for name2 in markNamesList])
+    assert len(chainsList) == len(expectedChainsSet)
+    assert set(chainsList) == expectedChainsSet
+
+
+def test_iterMarkStacks_roundRobin():
+    assembler = makeAssembler(makeStackFont())
+    # the first marks all show up before any of them shows up again
+    chainsList = list(islice(assembler.iterMarkStacks("a", 3), 3))
+    assert sorted(chain[1] for chain in chainsList) == [
+        "mark0", "mark1", "mark2"]
+
+
+def test_iterMarkStacks_depth():
+    assembler = makeAssembler(makeStackFont())
+    assert list(assembler.iterMarkStacks("a", 1)) == [
+        ("a", "mark0"), ("a", "mark1"), ("a", "mark2")]
+    assert max(len(chain) for chain in assembler.iterMarkStacks("a", 3)) == 4
+
+
+def test_getStackParts():
+    assembler = makeAssembler(makeStackFont())
+    assert assembler.getStackParts(("a", "mark0", "mark1")) == [
+        ("a", (0, 0)), ("mark0", (250, 100)), ("mark1", (250, 300))]
+
+
+def test_unnamedAnchors():
+    font = makeStackFont()
+    font["a"].appendAnchor({"x": 0, "y": 0})
+    font["mark0"].appendAnchor({"x": 0, "y": 0})
+    assembler = makeAssembler(font)
+    assert len(list(assembler.iterMarkStacks("a", 2))) == 12
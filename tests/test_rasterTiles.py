@@ -0,0 +1,176 @@
+"""
+Headless rasterization and caching of the combination tiles.
+"""
+
+import numpy as np
+import pytest
+from defcon import Font
+
+from previewGlyphs import newPreviewGlyph
+from rasterTiles import (Tile, TileCache, getTileKey, layoutLines,
+                         rasterizeGlyph)
+
+# one pixel per ten units
+POINT_SIZE = 100
+UNITS_PER_EM = 1000
+
+
+def drawRectangle(pen, xMin, yMin, xMax, yMax, clockwise=True):
+    pointsList = [(xMin, yMin), (xMin, yMax), (xMax, yMax), (xMax, yMin)]
+    if not clockwise:
+        pointsList.reverse()
+    pen.moveTo(pointsList[0])
+    for point in pointsList[1:]:
+        pen.lineTo(point)
+    pen.closePath()
+
+
+def makeTileFont():
+    font = Font()
+    font.info.unitsPerEm = UNITS_PER_EM
+    glyph = font.newGlyph("o")
+    glyph.width = 600
+    # a counter
+    drawRectangle(glyph.getPen(), 0, 0, 500, 500)
+    drawRectangle(glyph.getPen(), 150, 150, 350, 350, clockwise=False)
+    glyph = font.newGlyph("overlap")
+    glyph.width = 600
+    # overlapping contours, with the same direction
+    drawRectangle(glyph.getPen(), 0, 0, 300, 300)
+    drawRectangle(glyph.getPen(), 200, 200, 500, 500)
+    glyph = font.newGlyph("acute")
+    drawRectangle(glyph.getPen(), 200, 600, 300, 700)
+    return font
+
+
+def getCoverage(tile, x, y):
+    """
+    Returns the coverage of the pixel at (x, y) font units.
+    """
+    scale = float(POINT_SIZE) / UNITS_PER_EM
+    column = tile.originX + int(np.floor(x * scale))
+    row = tile.originY - int(np.ceil(y * scale))
+    return tile.alpha[row, column]
+
+
+def makeTile(byteCount):
+    return Tile(np.zeros(byteCount, dtype=np.uint8), 0, 0, 0, (0, 0, 0, 1))
+
+
+def test_rasterizeGlyph_counter():
+    font = makeTileFont()
+    tile = rasterizeGlyph(font["o"], POINT_SIZE, UNITS_PER_EM)
+    assert tile.advance == 60
+    assert getCoverage(tile, 50, 50) == 255
+    assert getCoverage(tile, 250, 250) == 0
+    assert getCoverage(tile, 450, 450) == 255
+    # the tile is cropped to the outlines, with one pixel of padding
+    assert tile.alpha.shape == (52, 52)
+    assert (tile.originX, tile.originY) == (1, 51)
+    assert not tile.alpha[0].any() and not tile.alpha[:, -1].any()
+    assert getCoverage(tile, 495, 250) == 255
+
+
+def test_rasterizeGlyph_nonzero():
+    font = makeTileFont()
+    tile = rasterizeGlyph(font["overlap"], POINT_SIZE, UNITS_PER_EM)
+    # the overlap is filled
+    assert getCoverage(tile, 250, 250) == 255
+    assert getCoverage(tile, 50, 50) == 255
+    assert getCoverage(tile, 450, 450) == 255
+    assert getCoverage(tile, 450, 50) == 0
+
+
+def test_rasterizeGlyph_empty():
+    font = makeTileFont()
+    tile = rasterizeGlyph(font.newGlyph("space"), POINT_SIZE, UNITS_PER_EM)
+    assert tile.alpha.shape == (0, 0)
+
+
+def test_rasterizeGlyph_components():
+    font = makeTileFont()
+    previewGlyph = newPreviewGlyph(
+        font.layers.defaultLayer, [("o", (0, 0)), ("acute", (50, 0))], 600)
+    tile = rasterizeGlyph(previewGlyph, POINT_SIZE, UNITS_PER_EM)
+    assert getCoverage(tile, 50, 50) == 255
+    assert getCoverage(tile, 300, 650) == 255
+    assert getCoverage(tile, 220, 650) == 0
+
+
+def test_TileCache_eviction():
+    tileCache = TileCache(maxBytes=300)
+    for key in "abc":
+        tileCache.put(key, makeTile(100))
+    assert tileCache.totalBytes == 300
+    # "a" becomes the most recently used
+    assert tileCache.get("a") is not None
+    tileCache.put("d", makeTile(100))
+    assert list(tileCache.tiles) == ["c", "a", "d"]
+    tileCache.put("e", makeTile(150))
+    assert list(tileCache.tiles) == ["d", "e"]
+    assert tileCache.totalBytes == 250
+    assert tileCache.get("b") is None
+    assert (tileCache.hits, tileCache.misses) == (1, 1)
+
+
+def test_TileCache_replace():
+    tileCache = TileCache(maxBytes=300)
+    tileCache.put("a", makeTile(100))
+    tileCache.put("a", makeTile(200))
+    assert tileCache.totalBytes == 200
+    # a tile bigger than the cache is kept until the next one
+    tileCache.put("b", makeTile(400))
+    assert list(tileCache.tiles) == ["b"]
+
+
+def test_TileCache_getCombinationTile():
+    font = makeTileFont()
+    tileCache = TileCache()
+    previewGlyph = newPreviewGlyph(font.layers.defaultLayer, [("o", (0, 0))], 600)
+    tile = tileCache.getCombinationTile(previewGlyph, POINT_SIZE)
+    assert tileCache.getCombinationTile(previewGlyph, POINT_SIZE) is tile
+    font["o"].move((10, 0))
+    assert tileCache.getCombinationTile(previewGlyph, POINT_SIZE) is not tile
+
+
+def test_getTileKey():
+    font = makeTileFont()
+    layer = font.layers.defaultLayer
+
+    def getKey(partsList=(("o", (0, 0)), ("acute", (50, 0))), width=600,
+               pointSize=POINT_SIZE):
+        return getTileKey(newPreviewGlyph(layer, partsList, width),
+                          pointSize, (0, 0, 0, 1))
+
+    key = getKey()
+    assert getKey() == key
+    assert getKey(pointSize=200) != key
+    assert getKey(width=650) != key
+    # component offsets
+    assert getKey((("o", (0, 0)), ("acute", (60, 0)))) != key
+    # margins
+    previewGlyph = newPreviewGlyph(
+        layer, [("o", (0, 0)), ("acute", (50, 0))], 600)
+    previewGlyph.leftMargin += 20
+    assert getTileKey(previewGlyph, POINT_SIZE, (0, 0, 0, 1)) != key
+    # contours
+    font["acute"].move((0, 10))
+    assert getKey() != key
+    key = getKey()
+    drawRectangle(font["o"].getPen(), 600, 0, 700, 100)
+    assert getKey() != key
+
+
+@pytest.mark.parametrize("advancesList, expected", [
+    # everything fits on one line
+    ([100, 100, 100], ([(10, 0), (110, 0), (210, 0)], 1)),
+    # the third item goes to the next line
+    ([200, 200, 200], ([(10, 0), (210, 0), (10, 1)], 2)),
+    # line breaks
+    ([100, None, 100, None], ([(10, 0), None, (10, 1), None], 3)),
+    # an item wider than the line gets a line of its own
+    ([500, 100], ([(10, 0), (10, 1)], 2)),
+    ([], ([], 1)),
+])
+def test_layoutLines(advancesList, expected):
+    assert layoutLines(advancesList, 420, margin=10) == expected